@@ -0,0 +1,242 @@
+from func_utils import API, DatabasePool, YOLOVideoCapture, FrameProcessor, PlateTracker, CropQualityGate, BusInfoPipeline, StreamingAnnouncer, arrival_message_fragments, arrival_messages, text_to_speech_ssml, play_pcm, warm_up_tts_cache, get_tts_client, get_stt_client, get_gps_service, gps_sub, GPS_MAX_AGE, GPS_TIMEOUT, streaming_recognize_speech, determine_intent
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+# 상시 실행 서비스: 모델/클라이언트를 한 번만 불러두고 Unix 소켓으로 요청을 받아 처리
+# main.py/stts.py는 실행할 때마다 YOLO 가중치, EasyOCR reader, Google 클라이언트를 새로 만들지만
+# 이 서비스는 시작할 때 한 번만 만들고, 요청마다 추론/조회/안내 시간만 씀
+#
+# 서비스 실행 : python bbs_daemon.py
+# 요청 보내기 : python bbs_daemon.py identify   (카메라로 버스 번호 인식 후 안내)
+#              python bbs_daemon.py voice      (음성으로 버스 번호를 듣고 안내)
+#              python bbs_daemon.py ping | shutdown
+# 요청/응답은 한 줄 텍스트: 요청은 명령 이름, 응답은 결과 JSON
+
+# 환경 변수 설정
+os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = '/home/minseokim521/catkin_ws/src/bus/zippy-brand-429513-k7-6ef67897540d.json'
+
+# 소켓 경로
+SOCKET_PATH = os.environ.get("BBS_SOCKET", "/tmp/bbs.sock")
+
+# 모델 경로
+model_path = "/home/minseokim521/catkin_ws/src/bus/Blind_Bus_Support-bbs-/models/best_3000_n.pt"
+
+# 인식 설정 (main.py와 동일)
+plate_class_names = ['front_num', 'side_num', 'back_num']
+padding = 5
+min_confidence = 0.8
+capture_deadline = 3.0
+
+NO_PLATE_MSG = "아무 번호도 인식되지 않았습니다."
+NO_VOICE_NUMBER_MSG = "버스 번호를 인식할 수 없습니다. 다시 시도해주세요."
+
+
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+------------------------------------------------------------------------------------------------------------------------------------
+------------------------------------------------------------------------------------------------------------------------------------
+                                                               Client
+------------------------------------------------------------------------------------------------------------------------------------
+------------------------------------------------------------------------------------------------------------------------------------
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+
+# 인자로 명령을 주면 서비스에 요청만 보내고 응답을 출력한 뒤 종료 (모델을 불러오지 않음)
+if len(sys.argv) > 1:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(SOCKET_PATH)
+        client.sendall((sys.argv[1] + "\n").encode("utf-8"))
+        print(client.makefile("r", encoding="utf-8").readline().strip())
+    sys.exit()
+
+
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+------------------------------------------------------------------------------------------------------------------------------------
+------------------------------------------------------------------------------------------------------------------------------------
+                                                          Warm-up section
+------------------------------------------------------------------------------------------------------------------------------------
+------------------------------------------------------------------------------------------------------------------------------------
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+# EasyOCR(torch)은 서비스로 실행할 때만 import (클라이언트로 요청만 보낼 때는 불러오지 않음)
+import easyocr
+
+load_start = time.time()
+
+# YOLO 비디오 캡처와 EasyOCR 초기화 (한 번만)
+video_capture = YOLOVideoCapture(model_path)
+easy_ocr = easyocr.Reader(['en'], gpu=True)
+plate_class_indices = [idx for idx, name in video_capture.model.names.items() if name in plate_class_names]
+
+frame_processor = FrameProcessor(
+    video_capture.model, plate_class_indices, easy_ocr,
+    video_capture.width, video_capture.height, padding, min_confidence,
+    ocr_mode="recognize",
+    tracker=PlateTracker(),
+    quality_gate=CropQualityGate()
+)
+
+# 카메라를 계속 열어두고 최근 프레임을 버퍼에 보관 (요청마다 카메라 열기/초점 대기 없음)
+video_capture.start_grabber()
+
+# DB/API 클라이언트, 정류소 스냅샷, routeid 사전
+# 파이프라인의 OCR/정류소 스레드와 routeid 자동 갱신이 동시에 DB를 쓰므로 연결 3개를 열어두고 재사용
+bus_api = API(db_pool=DatabasePool(minconn=3))
+bus_api.bus_routes.ensure_loaded()
+# 오래 실행되므로 routeid 사전은 백그라운드에서 주기적으로 다시 읽어옴
+bus_api.bus_routes.start_auto_refresh()
+bus_api.load_station_snapshot()
+
+# Google 음성 클라이언트, 고정 안내 문구 캐시, GPS 구독
+get_tts_client()
+get_stt_client()
+threading.Thread(target=warm_up_tts_cache, daemon=True).start()
+get_gps_service()
+
+announcer = StreamingAnnouncer()
+
+print(f"Warm-up took {time.time() - load_start} seconds.")
+
+
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+------------------------------------------------------------------------------------------------------------------------------------
+------------------------------------------------------------------------------------------------------------------------------------
+                                                          Request section
+------------------------------------------------------------------------------------------------------------------------------------
+------------------------------------------------------------------------------------------------------------------------------------
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+
+# 위치는 GPS_MAX_AGE초 이내의 것만 쓰고, 없으면 GPS_TIMEOUT초까지만 기다림 (요청 하나가 서비스를 멈추지 않도록)
+def locate():
+    return gps_sub(max_age=GPS_MAX_AGE, timeout=GPS_TIMEOUT)
+
+
+def speak(msg):
+    print(msg)
+    play_pcm(text_to_speech_ssml(msg, audio_encoding="LINEAR16"))
+
+
+def announce_arrival(bus_num, arrival):
+    for msg in arrival_messages(bus_num, arrival):
+        print(msg)
+    announcer.announce(arrival_message_fragments(bus_num, arrival))
+
+
+def identify_bus():
+    """카메라로 버스 번호를 인식하고 도착 정보를 안내 (main.py와 같은 흐름)."""
+    frame_processor.reset()
+    pipeline = BusInfoPipeline(video_capture, frame_processor, bus_api, locate, capture_deadline=capture_deadline)
+    result = pipeline.run()
+
+    reply = {"bus_num": result["bus_num"], "station_name": result["station_name"],
+             "station_id": result["station_id"], "arrival": None, "timings": result["timings"]}
+
+    if result["bus_num"] is None:
+        speak(NO_PLATE_MSG)
+        return reply
+    if result["routeid"] is None:
+        print("OCR상의 버스 번호가 DB와 일치하지 않습니다.")
+        return reply
+    if result["arrival"] is None:
+        return reply
+
+    reply["arrival"] = dict(result["arrival"])
+    announce_arrival(result["bus_num"], result["arrival"])
+    return reply
+
+
+def voice_query():
+    """음성으로 버스 번호를 듣고 도착 정보를 안내 (stts.py와 같은 흐름)."""
+    recognized_text, bus_number = streaming_recognize_speech(stop_on_number=True)
+    print(f"인식된 텍스트: {recognized_text}")
+
+    reply = {"text": recognized_text, "bus_num": bus_number, "intent": determine_intent(recognized_text),
+             "station_name": None, "station_id": None, "arrival": None}
+
+    if bus_number is None:
+        speak(NO_VOICE_NUMBER_MSG)
+        return reply
+
+    latitude, longitude = locate()
+    if latitude is None:
+        print("GPS 위치를 받지 못했습니다.")
+        return reply
+
+    stations = bus_api.load_station_snapshot()
+    index = bus_api.find_nearest_index(longitude, latitude)
+    reply["station_name"] = str(stations.station_name[index])
+    reply["station_id"] = str(stations.node_id[index])
+
+    if bus_api.resolve_bus_route(bus_number) is None:
+        print("STT로 인식된 버스 번호가 DB와 일치하지 않습니다.")
+        return reply
+
+    arrival = bus_api.parse_arrival_info(bus_api.station_bus_list(reply["station_id"])).find(bus_number)
+    if arrival is None:
+        print("인식된 버스가 해당 정류소에서 운행되지 않습니다.")
+        return reply
+
+    reply["arrival"] = dict(arrival)
+    announce_arrival(bus_number, arrival)
+    return reply
+
+
+COMMANDS = {
+    "identify": identify_bus,
+    "voice": voice_query,
+    "ping": lambda: {"status": "ok"},
+}
+
+
+# 요청 하나당 한 줄 명령을 읽고 한 줄 JSON으로 응답
+# 카메라/마이크/스피커를 같이 쓰므로 요청은 한 번에 하나씩 순서대로 처리 (UnixStreamServer는 단일 스레드)
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        command = self.rfile.readline().decode("utf-8").strip().lower()
+        start = time.time()
+
+        if command == "shutdown":
+            reply = {"status": "shutting down"}
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        elif command in COMMANDS:
+            try:
+                reply = COMMANDS[command]()
+            except Exception as e:
+                print(f"Request '{command}' failed: {str(e)}")
+                reply = {"error": str(e)}
+        else:
+            reply = {"error": f"unknown command '{command}'", "commands": sorted(COMMANDS) + ["shutdown"]}
+
+        reply["elapsed"] = time.time() - start
+        print(f"Request '{command}' took {reply['elapsed']} seconds.")
+        self.wfile.write((json.dumps(reply, ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+
+
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+------------------------------------------------------------------------------------------------------------------------------------
+------------------------------------------------------------------------------------------------------------------------------------
+                                                           Server section
+------------------------------------------------------------------------------------------------------------------------------------
+------------------------------------------------------------------------------------------------------------------------------------
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+# 이전 실행에서 남은 소켓 파일 제거
+if os.path.exists(SOCKET_PATH):
+    os.remove(SOCKET_PATH)
+
+server = socketserver.UnixStreamServer(SOCKET_PATH, RequestHandler)
+print(f"BBS daemon listening on {SOCKET_PATH}")
+
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    pass
+finally:
+    server.server_close()
+    if os.path.exists(SOCKET_PATH):
+        os.remove(SOCKET_PATH)
+    announcer.close()
+    video_capture.release()
+    bus_api.close()
+    print("BBS daemon stopped")
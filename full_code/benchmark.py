@@ -0,0 +1,240 @@
+from func_utils import YOLOVideoCapture, ReplayCapture, FrameProcessor, PlateTracker, CropQualityGate, PlateVote, StageTimer
+import argparse
+import csv
+import datetime
+import json
+import os
+import subprocess
+import time
+
+# 녹화된 영상/이미지로 번호판 인식 단계의 속도와 정확도를 측정하는 벤치마크
+# 웹캠 없이 ReplayCapture로 프레임을 읽어 main.py와 같은 설정의 FrameProcessor에 넣고
+# 단계별(capture, yolo, crop, preprocess, ocr) 시간, 초당 프레임 수, 프레임당 OCR 호출 수, 번호 정확도를 JSON으로 저장
+#
+# 실행 예:
+#   python benchmark.py clips/ --labels clips/labels.csv --output results/bench.json --baseline results/prev.json
+#
+# clip : 영상 파일 하나 또는 이미지 폴더 하나 (폴더 안에 영상/이미지 폴더가 여러 개면 각각이 clip)
+# labels : clip 이름(파일/폴더 이름)과 정답 번호. CSV("이름,번호") 또는 JSON({"이름": "번호"})
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+
+model_path = "/home/minseokim521/catkin_ws/src/bus/Blind_Bus_Support-bbs-/models/best_3000_n.pt"
+plate_class_names = ['front_num', 'side_num', 'back_num']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmark for plate detection + OCR")
+    parser.add_argument("sources", nargs="+", help="영상 파일, 이미지 폴더, 또는 clip들이 들어있는 폴더")
+    parser.add_argument("--labels", help="정답 파일 (CSV 또는 JSON)")
+    parser.add_argument("--model", default=model_path, help="YOLO 가중치 경로")
+    parser.add_argument("--rate", type=float, default=None, help="재생 속도(fps). 없으면 최대한 빨리")
+    parser.add_argument("--batch-size", type=int, default=4, help="한 번에 검출/OCR할 프레임 수")
+    parser.add_argument("--ocr-mode", default="recognize", choices=["recognize", "readtext"])
+    parser.add_argument("--no-tracker", action="store_true", help="PlateTracker 없이 실행")
+    parser.add_argument("--no-quality-gate", action="store_true", help="CropQualityGate 없이 실행")
+    parser.add_argument("--early-exit", action="store_true", help="번호가 결정되면 clip의 남은 프레임을 건너뜀 (실제 파이프라인과 같은 동작)")
+    parser.add_argument("--cpu", action="store_true", help="EasyOCR을 CPU로 실행")
+    parser.add_argument("--output", default="benchmark_results.json", help="결과 JSON 경로")
+    parser.add_argument("--baseline", help="비교할 이전 결과 JSON 경로")
+    return parser.parse_args()
+
+
+def expand_sources(sources):
+    """입력 경로들을 clip 목록으로 펼침. 이미지가 바로 들어있는 폴더는 clip 하나, 아니면 안의 영상/폴더가 각각 clip."""
+    clips = []
+    for source in sources:
+        if not os.path.isdir(source):
+            clips.append(source)
+            continue
+        names = sorted(os.listdir(source))
+        if any(name.lower().endswith(ReplayCapture.IMAGE_EXTENSIONS) for name in names):
+            clips.append(source)
+            continue
+        for name in names:
+            path = os.path.join(source, name)
+            if os.path.isdir(path) or name.lower().endswith(VIDEO_EXTENSIONS):
+                clips.append(path)
+    return clips
+
+
+def load_labels(path):
+    if not path:
+        return {}
+    if path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            return {str(name): str(number) for name, number in json.load(f).items()}
+
+    labels = {}
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or row[0].startswith("#") or row[0] == "name":
+                continue
+            labels[row[0].strip()] = row[1].strip()
+    return labels
+
+
+def clip_name(clip):
+    return os.path.basename(os.path.normpath(clip))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def run_clip(video_capture, frame_processor, timer, clip, args):
+    """clip 하나를 처리하고 결과(dict)를 반환."""
+    if not video_capture.open(clip, rate=args.rate):
+        return None
+    frame_processor.reset()
+    frame_processor.width, frame_processor.height = video_capture.width, video_capture.height
+
+    vote = PlateVote()
+    decided, decided_after = None, None
+    frame_count = 0
+    start = time.perf_counter()
+
+    while True:
+        frames = []
+        with timer.measure("capture"):
+            while len(frames) < args.batch_size:
+                ret, frame = video_capture.cap.read()
+                if not ret:
+                    break
+                frames.append(frame)
+        if not frames:
+            break
+
+        readings, _ = frame_processor.recognize_window(frames)
+        frame_count += len(frames)
+        vote.add(readings)
+
+        if decided is None:
+            decided = vote.decided()
+            if decided is not None:
+                decided_after = frame_count
+                if args.early_exit:
+                    break
+
+    elapsed = time.perf_counter() - start
+    return {
+        "clip": clip_name(clip),
+        "frames": frame_count,
+        "seconds": elapsed,
+        "fps": frame_count / elapsed if elapsed > 0 else 0.0,
+        "predicted": decided if decided is not None else vote.leader(),
+        "decided_after_frames": decided_after,
+        "votes": dict(vote.votes),
+    }
+
+
+def compare(result, baseline):
+    """이전 결과와 주요 지표 비교 출력."""
+    print(f"\n=== Compared with {baseline.get('commit')} ({baseline.get('timestamp')}) ===")
+    for key in ("fps", "ocr_calls_per_frame", "ocr_crops_per_frame", "accuracy"):
+        new, old = result["totals"].get(key), baseline.get("totals", {}).get(key)
+        if new is None or old is None:
+            continue
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"{key:>22} : {old:.3f} -> {new:.3f} ({change})")
+    for stage, stats in result["stages"].items():
+        old = baseline.get("stages", {}).get(stage)
+        if old is None:
+            continue
+        change = f"{(stats['mean_ms'] - old['mean_ms']) / old['mean_ms'] * 100:+.1f}%" if old["mean_ms"] else "n/a"
+        print(f"{stage + ' mean_ms':>22} : {old['mean_ms']:.2f} -> {stats['mean_ms']:.2f} ({change})")
+
+
+def main():
+    args = parse_args()
+    import easyocr
+
+    clips = expand_sources(args.sources)
+    if not clips:
+        print(f"No clips found in {args.sources}")
+        return
+    labels = load_labels(args.labels)
+    print(f"Clips : {len(clips)}, labeled : {sum(clip_name(clip) in labels for clip in clips)}")
+
+    # 모델과 OCR reader는 한 번만 불러오고 clip마다 소스만 바꿈 (해상도는 clip을 열 때마다 다시 설정)
+    video_capture = YOLOVideoCapture(args.model, source=clips[0], rate=args.rate)
+    if video_capture.model is None:
+        return
+    easy_ocr = easyocr.Reader(['en'], gpu=not args.cpu)
+    plate_class_indices = [idx for idx, name in video_capture.model.names.items() if name in plate_class_names]
+
+    timer = StageTimer()
+    frame_processor = FrameProcessor(
+        video_capture.model, plate_class_indices, easy_ocr,
+        video_capture.width, video_capture.height, 5, 0.8,
+        ocr_mode=args.ocr_mode,
+        tracker=None if args.no_tracker else PlateTracker(),
+        quality_gate=None if args.no_quality_gate else CropQualityGate(),
+        timer=timer,
+    )
+
+    clip_results = []
+    for clip in clips:
+        clip_result = run_clip(video_capture, frame_processor, timer, clip, args)
+        if clip_result is None:
+            continue
+        expected = labels.get(clip_result["clip"])
+        clip_result["expected"] = expected
+        clip_result["correct"] = None if expected is None else clip_result["predicted"] == expected
+        clip_results.append(clip_result)
+        print(f"{clip_result['clip']} : predicted {clip_result['predicted']}, expected {expected}, "
+              f"{clip_result['frames']} frames, {clip_result['fps']:.2f} fps")
+    video_capture.release()
+
+    summary = timer.summary()
+    counters = summary["counters"]
+    frames = sum(clip["frames"] for clip in clip_results)
+    seconds = sum(clip["seconds"] for clip in clip_results)
+    labeled = [clip for clip in clip_results if clip["correct"] is not None]
+    decided = [clip["decided_after_frames"] for clip in clip_results if clip["decided_after_frames"] is not None]
+
+    result = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "totals": {
+            "clips": len(clip_results),
+            "frames": frames,
+            "seconds": seconds,
+            "fps": frames / seconds if seconds > 0 else 0.0,
+            "ocr_calls_per_frame": counters.get("ocr_calls", 0) / frames if frames else 0.0,
+            "ocr_crops_per_frame": counters.get("ocr_crops", 0) / frames if frames else 0.0,
+            "plate_crops_per_frame": counters.get("plate_crops", 0) / frames if frames else 0.0,
+            "accuracy": sum(clip["correct"] for clip in labeled) / len(labeled) if labeled else None,
+            "mean_decided_after_frames": sum(decided) / len(decided) if decided else None,
+        },
+        "stages": summary["stages"],
+        "counters": counters,
+        "clips": clip_results,
+    }
+
+    print("\n=== Stage latency ===")
+    for stage, stats in result["stages"].items():
+        print(f"{stage:>10} : {stats['mean_ms']:8.2f} ms/call, {stats['calls']:5d} calls, {stats['total_s']:.2f} s total")
+    print("\n=== Totals ===")
+    for key, value in result["totals"].items():
+        print(f"{key:>26} : {value}")
+
+    output_dir = os.path.dirname(os.path.abspath(args.output))
+    os.makedirs(output_dir, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
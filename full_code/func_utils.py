@@ -1,33 +1,213 @@
-import psycopg2
-import requests
+import asyncio
 import xml.etree.ElementTree as ET
 import time
-from collections import Counter
-import cv2
-from ultralytics import YOLO
-import pyaudio
-from google.cloud import speech
-from google.cloud import texttospeech
-import rclpy
-from rclpy.node import Node
-from sensor_msgs.msg import NavSatFix
+from collections import Counter, OrderedDict, deque, namedtuple
+import importlib
+import weakref
+import contextlib
 import sys
 import os
 import numpy as np
 import re
 import wave
+import json
+import io
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty, Full
+
+
+# 처음 속성에 접근할 때 실제로 import하는 모듈 대리 객체
+# 무거운 모듈(cv2, ultralytics/torch, Google 클라이언트, ROS, DB 드라이버)을 쓰는 기능을 실제로 호출할 때만 불러와서
+# 음성만 쓰는 경로(stts.py)가 영상 처리 라이브러리의 import 시간을 기다리지 않도록 함
+class _LazyModule:
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)  # import 자체는 파이썬 import lock으로 스레드 안전
+        return self._module
+
+    def __getattr__(self, attr):
+        # _name/_module은 __init__에서 설정되므로 여기로 오지 않음
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+psycopg2 = _LazyModule("psycopg2")
+pg_pool = _LazyModule("psycopg2.pool")
+aiohttp = _LazyModule("aiohttp")
+cv2 = _LazyModule("cv2")
+ultralytics = _LazyModule("ultralytics")
+pyaudio = _LazyModule("pyaudio")
+speech = _LazyModule("google.cloud.speech")
+texttospeech = _LazyModule("google.cloud.texttospeech")
+rclpy = _LazyModule("rclpy")
+rclpy_executors = _LazyModule("rclpy.executors")
+sa = _LazyModule("simpleaudio")
+
+
+# 녹화된 영상 파일이나 이미지 폴더를 카메라처럼 읽는 재생 소스 (cv2.VideoCapture와 같은 read/get/set/release 제공)
+# /dev/video0 없이 FrameProcessor의 속도와 정확도를 측정하거나 같은 장면을 반복해서 테스트할 때 사용
+class ReplayCapture:
+    IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+    def __init__(self, source, rate=None, loop=False):
+        """
+        Parameters:
+            source (str): 영상 파일 경로 또는 이미지 폴더 경로 (폴더는 파일 이름 순서로 읽음).
+            rate (float): 초당 프레임 수. 이 속도에 맞춰 read가 기다림. None이면 기다리지 않고 최대한 빨리.
+            loop (bool): 끝까지 읽으면 처음부터 다시 읽을지 여부.
+        """
+        self.source = source
+        self.rate = rate
+        self.loop = loop
+        self.position = 0       # 지금까지 읽은 프레임 수
+        self.frame_name = None  # 마지막으로 읽은 프레임의 이름 (이미지 파일 이름 또는 "영상이름#번호")
+        self._next_time = None
+        self._size = None
+
+        self.images = None
+        self.video = None
+        if os.path.isdir(source):
+            self.images = sorted(os.path.join(source, name) for name in os.listdir(source)
+                                 if name.lower().endswith(self.IMAGE_EXTENSIONS))
+        else:
+            self.video = cv2.VideoCapture(source)
+
+    def isOpened(self):
+        if self.images is not None:
+            return bool(self.images)
+        return self.video.isOpened()
+
+    def _pace(self):
+        # rate에 맞춰 다음 프레임 시각까지 기다림
+        if not self.rate:
+            return
+        now = time.time()
+        if self._next_time is not None and self._next_time > now:
+            time.sleep(self._next_time - now)
+            now = self._next_time
+        self._next_time = now + 1.0 / self.rate
+
+    def _read_image(self):
+        failures = 0
+        # 모든 이미지를 한 번씩 실패하면 (읽을 수 있는 이미지가 없으면) loop여도 종료
+        while (self.loop or self.position < len(self.images)) and failures < len(self.images):
+            path = self.images[self.position % len(self.images)]
+            frame = cv2.imread(path)
+            if frame is not None:
+                self.frame_name = os.path.basename(path)
+                return True, frame
+            print(f"이미지를 읽지 못했습니다: {path}")
+            self.position += 1
+            failures += 1
+        return False, None
+
+    def _read_video(self):
+        ret, frame = self.video.read()
+        if not ret and self.loop and self.position > 0:
+            self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.video.read()
+        if ret:
+            self.frame_name = f"{os.path.basename(self.source)}#{self.position}"
+        return ret, frame
+
+    def read(self):
+        if not self.isOpened():
+            return False, None
+        self._pace()
+        ret, frame = self._read_image() if self.images is not None else self._read_video()
+        if ret:
+            self.position += 1
+            if self._size is None:
+                self._size = (frame.shape[1], frame.shape[0])
+        return ret, frame
+
+    def _frame_size(self):
+        if self._size is None and self.images:
+            frame = cv2.imread(self.images[0])
+            if frame is not None:
+                self._size = (frame.shape[1], frame.shape[0])
+        return self._size or (0, 0)
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            if self.rate:
+                return float(self.rate)
+            return self.video.get(prop) if self.video is not None else 0.0
+        if self.video is not None:
+            return self.video.get(prop)
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self._frame_size()[0])
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self._frame_size()[1])
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.images))
+        return 0.0
+
+    def set(self, prop, value):
+        # 녹화된 소스는 해상도/초점 설정을 바꿀 수 없음
+        return False
+
+    def release(self):
+        if self.video is not None:
+            self.video.release()
 
 
 # YOLO 모델을 초기화하고 비디오에서 프레임을 읽는 기능을 제공
 # 비디오 파일에서 프레임을 일정한 간격으로 추출하여 처리할 수 있게 함
 class YOLOVideoCapture:
-    def __init__(self, model_path):
+    def __init__(self, model_path, source=None, rate=None, loop=False):
+        """
+        Parameters:
+            model_path (str): YOLO 가중치 경로.
+            source (str): None이면 웹캠(/dev/video0), 아니면 ReplayCapture로 읽을 영상 파일 또는 이미지 폴더.
+            rate (float): 재생 소스의 초당 프레임 수 (None이면 최대한 빨리).
+            loop (bool): 재생 소스를 끝까지 읽으면 처음부터 반복할지 여부.
+        """
+        self.cap = None
+        # 소스를 열지 못해도 속성은 있도록 기본값 설정 (open에 성공하면 실제 값으로 바뀜)
+        self.fps = 0.0
+        self.width = 0
+        self.height = 0
+        # 상시 캡처(grabber) 모드 상태
+        self._grabber_thread = None
+        self._grabber_stop = threading.Event()
+        self._frame_buffer = deque()
+        self._frame_cond = threading.Condition()
+        self._frame_seq = 0
         try:
             # YOLO 모델 초기화
-            self.model = YOLO(model_path)
+            self.model = ultralytics.YOLO(model_path)
             self.model.overrides['verbose'] = False
             
             # 비디오 캡처 초기화
+            self.open(source, rate, loop)
+
+        except Exception as e:
+            # 모델 로드 실패 시 예외 처리 및 로그 출력
+            print(f"모델을 로드하는 중 오류가 발생했습니다: {str(e)}")
+            self.model = None  # 모델 로드 실패 시 None으로 설정
+
+
+    def open(self, source=None, rate=None, loop=False):
+        """
+        카메라 또는 재생 소스를 (다시) 엽니다. YOLO 모델은 다시 불러오지 않습니다.
+
+        Returns:
+            bool: 열기에 성공했는지 여부.
+        """
+        self.release()
+        self.cap = None
+
+        if source is None:
             video_device = "/dev/video0"
             self.cap = cv2.VideoCapture(video_device)
 
@@ -36,26 +216,32 @@ class YOLOVideoCapture:
             self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 1080)
             # 자동 초점 설정 (자동 초점을 지원하는 경우)
             self.cap.set(cv2.CAP_PROP_AUTOFOCUS, 1)  # 1로 설정하여 자동 초점 활성화
-
-            # 웹캠 연결 확인
-            if not self.cap.isOpened():
-                print("웹캠을 열 수 없습니다. 웹캠이 제대로 연결되었는지 확인하세요.")
-                self.cap = None  # 웹캠이 연결되지 않았음을 나타내기 위해 None으로 설정
-            else:
-                print("웹캠이 성공적으로 연결되었습니다.")
-                self.fps = self.cap.get(cv2.CAP_PROP_FPS)
-                self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                print(f"해상도: {self.width}x{self.height}")
-                
-
-        except Exception as e:
-            # 모델 로드 실패 시 예외 처리 및 로그 출력
-            print(f"모델을 로드하는 중 오류가 발생했습니다: {str(e)}")
-            self.model = None  # 모델 로드 실패 시 None으로 설정
-
+        else:
+            self.cap = ReplayCapture(source, rate=rate, loop=loop)
+
+        # 웹캠 연결 확인
+        if not self.cap.isOpened():
+            print("웹캠을 열 수 없습니다. 웹캠이 제대로 연결되었는지 확인하세요." if source is None
+                  else f"재생 소스를 열 수 없습니다: {source}")
+            self.cap = None  # 웹캠이 연결되지 않았음을 나타내기 위해 None으로 설정
+            return False
+
+        print("웹캠이 성공적으로 연결되었습니다." if source is None else f"재생 소스를 열었습니다: {source}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        print(f"해상도: {self.width}x{self.height}")
+        return True
 
     def read_frames(self):
+        # 상시 캡처 중이면 카메라를 새로 읽지 않고 버퍼의 최근 프레임을 바로 사용
+        if self.grabbing:
+            frames = self.latest_frames(3, max_age=1.0, wait=1.0)
+            if frames:
+                print("캡쳐된 frame의 수 : ",len(frames))
+                yield frames
+            return
+
         frames = []
         start_time = time.time()  # 시작 시간 설정
 
@@ -82,39 +268,1026 @@ class YOLOVideoCapture:
         self.release()  # 비디오 캡처를 해제
 
     
+    def iter_frames(self, duration):
+        """
+        duration초 동안 프레임을 한 장씩 yield합니다 (다 쓴 뒤에도 release하지 않음).
+        상시 캡처 중이면 버퍼에 새로 들어온 프레임만 사용합니다.
+        """
+        if self.cap is None:
+            print("웹캠이 열리지 않았기 때문에 프레임을 읽을 수 없습니다.")
+            return
+
+        deadline = time.time() + duration
+        if not self.grabbing:
+            while time.time() < deadline:
+                ret, frame = self.cap.read()
+                if not ret:
+                    print("프레임을 읽지 못했습니다.")
+                    break
+                yield frame
+            return
+
+        # 상시 캡처: 가장 최근 프레임부터 시작해서 새 프레임이 들어올 때마다 전달
+        last_seq = self._frame_seq - 1
+        while True:
+            with self._frame_cond:
+                while self._frame_seq <= last_seq:
+                    remaining = deadline - time.time()
+                    if remaining <= 0 or not self.grabbing:
+                        return
+                    self._frame_cond.wait(min(remaining, 0.1))
+                last_seq = self._frame_seq
+                frame = self._frame_buffer[-1][1]
+            yield frame
+            if time.time() >= deadline:
+                return
+
+    @property
+    def grabbing(self):
+        return self._grabber_thread is not None and self._grabber_thread.is_alive()
+
+    def start_grabber(self, buffer_size=8):
+        """
+        상시 캡처 모드: 백그라운드 스레드가 계속 프레임을 읽어 최근 buffer_size장을 (시각, 프레임)으로 보관합니다.
+        카메라 열기/초점 맞추기/캡처 대기 시간 없이 latest_frames로 바로 프레임을 가져갈 수 있습니다.
+        """
+        if self.cap is None:
+            print("웹캠이 열리지 않았기 때문에 상시 캡처를 시작할 수 없습니다.")
+            return False
+        if self.grabbing:
+            return True
+        with self._frame_cond:
+            self._frame_buffer = deque(maxlen=buffer_size)
+        self._grabber_stop.clear()
+        self._grabber_thread = threading.Thread(target=self._grab_loop, name="frame-grabber", daemon=True)
+        self._grabber_thread.start()
+        return True
+
+    def stop_grabber(self):
+        self._grabber_stop.set()
+        if self._grabber_thread is not None:
+            self._grabber_thread.join(timeout=1.0)
+            self._grabber_thread = None
+
+    def _grab_loop(self):
+        while not self._grabber_stop.is_set():
+            ret, frame = self.cap.read()
+            if not ret:
+                time.sleep(0.01)
+                continue
+            with self._frame_cond:
+                self._frame_buffer.append((time.time(), frame))
+                self._frame_seq += 1
+                self._frame_cond.notify_all()
+
+    def latest_frames(self, n=3, max_age=None, wait=0.0):
+        """
+        상시 캡처 버퍼에서 가장 최근 프레임 n장을 (오래된 것부터) 반환합니다.
+
+        Parameters:
+            n (int): 가져올 프레임 수.
+            max_age (float): 이 시간(초)보다 오래된 프레임은 제외.
+            wait (float): 조건에 맞는 프레임이 하나도 없을 때 새 프레임을 기다릴 최대 시간(초).
+        """
+        deadline = time.time() + wait
+        with self._frame_cond:
+            while True:
+                now = time.time()
+                entries = [(ts, frame) for ts, frame in self._frame_buffer
+                           if max_age is None or now - ts <= max_age]
+                if entries or now >= deadline:
+                    break
+                self._frame_cond.wait(deadline - now)
+        return [frame for _, frame in entries[-n:]]
+
     def release(self):
+        self.stop_grabber()
         if self.cap:
             self.cap.release()
         
 
 
 class ImageProcessor:
-    @staticmethod
-    def preprocess_image(image):
-        """이미지 전처리 함수."""
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        clahe = cv2.createCLAHE(clipLimit=2.5, tileGridSize=(6, 6))
-        gray = clahe.apply(gray)
-        blurred = cv2.GaussianBlur(cv2.medianBlur(gray, 7), (5, 5), 0)
-        _, binary = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        
-        morph_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
-        binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, morph_kernel)
-        binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, morph_kernel)
-        
+    # 이 면적(px)보다 작은 연결 요소는 잡음으로 보고 제거
+    MIN_COMPONENT_AREA = 70
+    # 스레드마다 버퍼를 보관할 최대 이미지 크기(shape) 종류 수
+    MAX_BUFFER_SHAPES = 16
+
+    # CLAHE 객체와 중간 버퍼는 스레드별로, morphology 커널은 전체에서 한 번만 생성
+    _local = threading.local()
+    _morph_kernel = None
+
+    @classmethod
+    def _workspace(cls, shape):
+        """현재 스레드의 CLAHE 객체와, 이미지 크기별로 재사용하는 중간 버퍼 2개를 반환."""
+        local = cls._local
+        if not hasattr(local, "clahe"):
+            local.clahe = cv2.createCLAHE(clipLimit=2.5, tileGridSize=(6, 6))
+            local.buffers = OrderedDict()
+        if cls._morph_kernel is None:
+            cls._morph_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
+
+        buffers = local.buffers.get(shape)
+        if buffers is None:
+            buffers = (np.empty(shape, dtype=np.uint8), np.empty(shape, dtype=np.uint8))
+            local.buffers[shape] = buffers
+            if len(local.buffers) > cls.MAX_BUFFER_SHAPES:
+                local.buffers.popitem(last=False)
+        else:
+            local.buffers.move_to_end(shape)
+        return local.clahe, buffers
+
+    @classmethod
+    def preprocess_image(cls, image):
+        """이미지 전처리 함수. 반환되는 이진 이미지는 호출마다 새로 할당됨 (중간 결과만 버퍼 재사용)."""
+        shape = image.shape[:2]
+        clahe, (buf_a, buf_b) = cls._workspace(shape)
+        kernel = cls._morph_kernel
+
+        cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=buf_a)
+        clahe.apply(buf_a, dst=buf_b)
+        cv2.medianBlur(buf_b, 7, dst=buf_a)
+        cv2.GaussianBlur(buf_a, (5, 5), 0, dst=buf_b)
+
+        binary = np.empty(shape, dtype=np.uint8)
+        cv2.threshold(buf_b, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=binary)
+        cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel, dst=buf_a)
+        cv2.morphologyEx(buf_a, cv2.MORPH_CLOSE, kernel, dst=binary)
+
+        # 작은 연결 요소 제거: 라벨별 유지 여부 표를 labels로 인덱싱해서 한 번에 처리
         num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
-        for i in range(1, num_labels):
-            if stats[i, cv2.CC_STAT_AREA] < 70:
-                binary[labels == i] = 0
-        
+        keep = stats[:, cv2.CC_STAT_AREA] >= cls.MIN_COMPONENT_AREA
+        keep[0] = True  # 배경(0번 라벨)은 그대로
+        binary[~keep[labels]] = 0
+
         return binary
 
 
 
+# 정류소 좌표(경도 X, 위도 Y)를 격자(grid)로 나누어 저장하는 공간 인덱스
+# 한 번 만들어두면 최근접 k개 / 반경 내 정류소 조회를 전체 스캔 없이 처리할 수 있음
+# 거리는 모두 하버사인(haversine) 공식으로 계산한 미터 단위 지구 표면 거리
+class StationIndex:
+    EARTH_RADIUS_M = 6371008.8
+    METERS_PER_DEGREE = EARTH_RADIUS_M * np.pi / 180.0
+
+    def __init__(self, x_list, y_list, cell_size=0.005):
+        """
+        Parameters:
+            x_list (list): 정류소 경도(X_location) 리스트.
+            y_list (list): 정류소 위도(Y_location) 리스트.
+            cell_size (float): 격자 한 칸의 크기(도 단위). 0.005도는 서울 기준 약 450~550m.
+        """
+        self.x = np.asarray(x_list, dtype=np.float64)
+        self.y = np.asarray(y_list, dtype=np.float64)
+        self.cell_size = cell_size
+        self.cells = {}
+
+        valid = np.flatnonzero(np.isfinite(self.x) & np.isfinite(self.y))
+        if valid.size == 0:
+            self.bounds = None
+            return
+
+        cx = np.floor(self.x[valid] / cell_size).astype(np.int64)
+        cy = np.floor(self.y[valid] / cell_size).astype(np.int64)
+        buckets = {}
+        for i, key in zip(valid.tolist(), zip(cx.tolist(), cy.tolist())):
+            buckets.setdefault(key, []).append(i)
+        self.cells = {key: np.array(idx, dtype=np.int64) for key, idx in buckets.items()}
+
+        # 격자가 차지하는 범위 (링 탐색 종료 조건에 사용)
+        self.bounds = (int(cx.min()), int(cx.max()), int(cy.min()), int(cy.max()))
+
+    def __len__(self):
+        return len(self.x)
+
+    @classmethod
+    def haversine(cls, lon1, lat1, lon2, lat2):
+        """두 좌표(들) 사이의 지표면 거리를 미터 단위로 반환."""
+        lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+        a = np.sin((lat2 - lat1) / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+        return 2.0 * cls.EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+    def _cell_of(self, lon, lat):
+        return int(np.floor(lon / self.cell_size)), int(np.floor(lat / self.cell_size))
+
+    def _ring(self, cx, cy, r):
+        """(cx, cy)를 중심으로 체비셰프 거리가 정확히 r인 격자들의 인덱스를 모아서 반환."""
+        min_cx, max_cx, min_cy, max_cy = self.bounds
+        # 격자 범위를 벗어나는 칸은 비어 있으므로 범위와 겹치는 부분만 확인
+        xs = range(max(cx - r, min_cx), min(cx + r, max_cx) + 1)
+        ys = range(max(cy - r + 1, min_cy), min(cy + r - 1, max_cy) + 1)
+        keys = []
+        for gy in {cy - r, cy + r}:
+            keys += [(gx, gy) for gx in xs]
+        for gx in {cx - r, cx + r}:
+            keys += [(gx, gy) for gy in ys]
+        found = [self.cells[k] for k in keys if k in self.cells]
+        if not found:
+            return None
+        return np.concatenate(found)
+
+    def _ring_lower_bound(self, lon, lat, cx, cy, r):
+        """링 r까지 탐색했을 때, 아직 보지 않은 정류소까지의 최소 가능 거리(m)."""
+        cs = self.cell_size
+        dlat = min(lat - (cy - r) * cs, (cy + r + 1) * cs - lat)
+        dlon = min(lon - (cx - r) * cs, (cx + r + 1) * cs - lon)
+        # 경도 1도의 길이는 위도가 높을수록 짧아지므로 탐색 영역 중 가장 고위도 기준으로 보수적으로 계산
+        max_lat = min(abs(lat) + (r + 1) * cs, 90.0)
+        bound = min(dlat, dlon * np.cos(np.radians(max_lat))) * self.METERS_PER_DEGREE
+        return bound * 0.995  # 평면 근사 오차 여유분
+
+    def nearest(self, lon, lat, k=1):
+        """
+        (lon, lat)에서 가장 가까운 정류소 k개를 찾습니다.
+
+        Returns:
+            list: (정류소 인덱스, 거리[m]) 튜플의 리스트. 거리 오름차순.
+        """
+        if self.bounds is None or k <= 0:
+            return []
+
+        cx, cy = self._cell_of(lon, lat)
+        min_cx, max_cx, min_cy, max_cy = self.bounds
+        max_r = max(abs(cx - min_cx), abs(cx - max_cx), abs(cy - min_cy), abs(cy - max_cy))
+
+        # 질의 좌표가 격자 범위 밖이면 범위에 닿는 링부터 시작 (그 안쪽 링은 비어 있음)
+        r = max(min_cx - cx, cx - max_cx, min_cy - cy, cy - max_cy, 0)
+
+        cand_idx = np.empty(0, dtype=np.int64)
+        cand_dist = np.empty(0, dtype=np.float64)
+        while r <= max_r:
+            ring = self._ring(cx, cy, r)
+            if ring is not None:
+                dist = self.haversine(lon, lat, self.x[ring], self.y[ring])
+                cand_idx = np.concatenate((cand_idx, ring))
+                cand_dist = np.concatenate((cand_dist, dist))
+                if len(cand_idx) > k:
+                    keep = np.argpartition(cand_dist, k - 1)[:k]
+                    cand_idx, cand_dist = cand_idx[keep], cand_dist[keep]
+
+            # k개를 모았고, 바깥 링의 최소 거리가 현재 k번째 거리보다 멀면 종료
+            if len(cand_idx) >= k and cand_dist.max() <= self._ring_lower_bound(lon, lat, cx, cy, r):
+                break
+            r += 1
+
+        order = np.argsort(cand_dist, kind="stable")
+        return [(int(cand_idx[i]), float(cand_dist[i])) for i in order[:k]]
+
+    def within_radius(self, lon, lat, radius):
+        """
+        (lon, lat)에서 radius(m) 이내에 있는 정류소를 모두 찾습니다.
+
+        Returns:
+            list: (정류소 인덱스, 거리[m]) 튜플의 리스트. 거리 오름차순.
+        """
+        if self.bounds is None or radius < 0:
+            return []
+
+        cs = self.cell_size
+        dlat = radius / self.METERS_PER_DEGREE
+        max_lat = min(abs(lat) + dlat, 89.9)
+        dlon = min(radius / (self.METERS_PER_DEGREE * np.cos(np.radians(max_lat))), 180.0)
+
+        x0, y0 = self._cell_of(lon - dlon, lat - dlat)
+        x1, y1 = self._cell_of(lon + dlon, lat + dlat)
+        found = [self.cells[(gx, gy)]
+                 for gx in range(x0, x1 + 1)
+                 for gy in range(y0, y1 + 1)
+                 if (gx, gy) in self.cells]
+        if not found:
+            return []
+
+        cand = np.concatenate(found)
+        dist = self.haversine(lon, lat, self.x[cand], self.y[cand])
+        mask = dist <= radius
+        cand, dist = cand[mask], dist[mask]
+        order = np.argsort(dist, kind="stable")
+        return [(int(cand[i]), float(dist[i])) for i in order]
+
+
+# PostgreSQL 접속 정보
+DB_CONFIG = {"host": "122.44.85.37", "dbname": "postgres", "user": "postgres", "password": "postgres", "port": "5432"}
+
+# API가 소유하는 PostgreSQL 커넥션 풀
+# 쿼리마다 새로 연결(TCP + 인증)하지 않고 연결을 재사용하며, 오래 쉰 연결은 사용 전에 상태를 확인하고
+# 끊어진 연결은 버리고 다시 연결해서 한 번 재시도함
+class DatabasePool:
+    # 서버 측 prepared statement (연결마다 처음 사용할 때 PREPARE)
+    PREPARED_STATEMENTS = {
+        "bus_routeid": "SELECT routeid FROM bus WHERE bus_id = $1",
+    }
+
+    def __init__(self, minconn=1, maxconn=4, health_check_interval=30.0, db_config=None):
+        """
+        Parameters:
+            minconn (int): 풀에 유지할 연결 수. 풀을 만들 때 이 수만큼 바로 연결하고, 반납된 연결 중 이 수를 넘는 것은 닫음.
+                           한 번 실행하고 끝나는 스크립트는 1, 오래 실행되는 서비스는 동시에 DB를 쓰는 스레드 수에 맞춤.
+            maxconn (int): 동시에 열 수 있는 최대 연결 수.
+            health_check_interval (float): 이 시간(초) 이상 쉬었던 연결은 사용 전에 SELECT 1로 확인.
+            db_config (dict): psycopg2.connect 인자. 없으면 DB_CONFIG 사용.
+        """
+        self.minconn = min(minconn, maxconn)
+        self.maxconn = maxconn
+        self.health_check_interval = health_check_interval
+        self.db_config = db_config or DB_CONFIG
+        self._pool = None
+        self._lock = threading.Lock()
+        # 연결별 상태는 연결 객체를 키로 보관 (id()는 닫힌 연결의 값이 새 연결에 재사용될 수 있음)
+        self._prepared = weakref.WeakKeyDictionary()   # conn -> 이 연결에서 PREPARE한 이름들
+        self._last_used = weakref.WeakKeyDictionary()  # conn -> 마지막 사용 시각
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = pg_pool.ThreadedConnectionPool(self.minconn, self.maxconn, **self.db_config)
+            return self._pool
+
+    def _discard(self, conn):
+        self._forget(conn)
+        try:
+            self._get_pool().putconn(conn, close=True)
+        except Exception:
+            pass
+
+    def _forget(self, conn):
+        self._prepared.pop(conn, None)
+        self._last_used.pop(conn, None)
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        if time.time() - self._last_used.get(conn, 0) < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def _checkout(self):
+        pool = self._get_pool()
+        for _ in range(self.maxconn + 1):
+            conn = pool.getconn()
+            if conn not in self._last_used:
+                # 새 연결: 조회만 하므로 autocommit으로 두어 idle in transaction 상태를 만들지 않음
+                conn.autocommit = True
+                self._prepared[conn] = set()
+            elif not self._is_healthy(conn):
+                print("Dropping broken database connection.")
+                self._discard(conn)
+                continue
+            return conn
+        raise psycopg2.OperationalError("could not get a healthy database connection")
+
+    def _checkin(self, conn):
+        self._last_used[conn] = time.time()
+        self._get_pool().putconn(conn)
+        # 풀이 minconn을 넘는 연결은 반납할 때 닫으므로, 닫힌 연결의 상태는 바로 지움
+        if conn.closed:
+            self._forget(conn)
+
+    def run(self, fn, retries=1):
+        """
+        풀에서 연결을 꺼내 fn(conn)을 실행하고 결과를 반환합니다.
+        연결이 끊어진 경우 연결을 버리고 retries번까지 다시 시도합니다.
+        """
+        for attempt in range(retries + 1):
+            conn = self._checkout()
+            try:
+                result = fn(conn)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                self._discard(conn)
+                if attempt == retries:
+                    raise
+                print(f"Database connection lost, reconnecting: {str(e)}")
+                continue
+            except Exception:
+                self._checkin(conn)
+                raise
+            self._checkin(conn)
+            return result
+
+    def fetchone(self, sql_query, params=None):
+        def _fetch(conn):
+            with conn.cursor() as cursor:
+                cursor.execute(sql_query, params)
+                return cursor.fetchone()
+        return self.run(_fetch)
+
+    def fetchall(self, sql_query, params=None):
+        def _fetch(conn):
+            with conn.cursor() as cursor:
+                cursor.execute(sql_query, params)
+                return cursor.fetchall()
+        return self.run(_fetch)
+
+    def execute_prepared(self, name, params, fetch="one"):
+        """PREPARED_STATEMENTS에 등록된 쿼리를 이름으로 실행합니다."""
+        def _execute(conn):
+            with conn.cursor() as cursor:
+                prepared = self._prepared.setdefault(conn, set())
+                if name not in prepared:
+                    cursor.execute(f"PREPARE {name} AS {self.PREPARED_STATEMENTS[name]};")
+                    prepared.add(name)
+                placeholders = ", ".join(["%s"] * len(params))
+                cursor.execute(f"EXECUTE {name} ({placeholders});", params)
+                return cursor.fetchone() if fetch == "one" else cursor.fetchall()
+        return self.run(_execute)
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+            self._prepared.clear()
+            self._last_used.clear()
+
+
+# bus 테이블(버스 번호 -> routeid)을 통째로 메모리에 올려두는 사전
+# 버스 테이블은 작고 거의 바뀌지 않으므로, 인식된 번호마다 DB에 묻는 대신 O(1)로 검증
+class BusRouteMap:
+    def __init__(self, db, refresh_interval=3600.0, table="bus"):
+        """
+        Parameters:
+            db (DatabasePool): 조회에 사용할 커넥션 풀.
+            refresh_interval (float): start_auto_refresh 사용 시 다시 읽어오는 주기(초).
+            table (str): 버스 테이블 이름.
+        """
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self.table = table
+        self.loaded_at = None
+        self._routes = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()  # 처음 읽어오기는 한 스레드만 (나머지는 그 결과를 기다림)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def load(self):
+        """DB에서 버스 번호와 routeid를 모두 읽어와 사전을 교체합니다."""
+        rows = self.db.fetchall(f"SELECT bus_id, routeid FROM {self.table};")
+        routes = {str(bus_id).strip(): routeid for bus_id, routeid in rows}
+        with self._lock:
+            self._routes = routes
+            self.loaded_at = time.time()
+        print(f"Bus route map loaded ({len(routes)} routes).")
+        return routes
+
+    def invalidate(self, reload=False):
+        """사전을 비웁니다. 다음 조회 때 다시 읽어오며, reload=True면 바로 다시 읽어옵니다."""
+        with self._lock:
+            self._routes = None
+            self.loaded_at = None
+        if reload:
+            self.load()
+
+    def _get_routes(self):
+        routes = self._routes
+        if routes is None:
+            # OCR 검증과 정류소 준비 스레드가 동시에 처음 조회해도 DB에서는 한 번만 읽어옴
+            with self._load_lock:
+                routes = self._routes
+                if routes is None:
+                    routes = self.load()
+        return routes
+
+    def ensure_loaded(self):
+        """아직 읽어오지 않았으면 지금 읽어옵니다 (미리 로드용)."""
+        self._get_routes()
+
+    def resolve(self, bus_num):
+        """버스 번호에 해당하는 routeid를 반환. 없으면 None."""
+        if bus_num is None:
+            return None
+        return self._get_routes().get(str(bus_num).strip())
+
+    def resolve_many(self, candidates):
+        """
+        여러 후보 번호를 한 번에 검증합니다.
+
+        Returns:
+            dict: {버스 번호: routeid}. DB에 있는 번호만, 입력 순서대로 포함.
+        """
+        routes = self._get_routes()
+        resolved = {}
+        for candidate in candidates:
+            if candidate is None:
+                continue
+            key = str(candidate).strip()
+            if key in routes and key not in resolved:
+                resolved[key] = routes[key]
+        return resolved
+
+    def __contains__(self, bus_num):
+        return self.resolve(bus_num) is not None
+
+    def start_auto_refresh(self):
+        """백그라운드 스레드에서 refresh_interval마다 사전을 다시 읽어옵니다."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name="bus-route-refresh", daemon=True)
+        self._thread.start()
+
+    def stop_auto_refresh(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def _refresh_loop(self):
+        while not self._stop_event.wait(self.refresh_interval):
+            try:
+                self.load()
+            except Exception as e:
+                # 갱신에 실패하면 기존 사전을 계속 사용
+                print(f"Bus route map refresh failed: {str(e)}")
+
+
+# 서울시 버스 정보 API (ws.bus.go.kr)
+BUS_API_SERVICE_KEY = "lnGvRUsSrOgezp/xjHmRf1XJipLQd9ANFdkUk5w2kB1FaTDTAcS88zmKBViC6HYFRcWfhGjkuNQD85aNrvoTTw=="
+BUS_API_ENDPOINTS = {
+    "station_bus_list": "http://ws.bus.go.kr/api/rest/arrive/getLowArrInfoByStId",
+    "bus_station_list": "http://ws.bus.go.kr/api/rest/busRouteInfo/getStaionByRoute",
+    "station_arrival_info": "http://ws.bus.go.kr/api/rest/arrive/getLowArrInfoByRoute",
+    "station_pose": "http://ws.bus.go.kr/api/rest/stationinfo/getStationByPos",
+}
+
+
+# 짧은 시간 동안만 유효한 응답을 저장하는 TTL + LRU 캐시
+# 만료 시간이 지난 값은 없는 것으로 취급하고, maxsize를 넘으면 가장 오래 쓰지 않은 값부터 버림
+class TTLCache:
+    def __init__(self, ttl=5.0, maxsize=256):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # key -> (만료 시각, 값)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """(찾았는지 여부, 값)을 반환."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def record_coalesced(self):
+        """캐시에는 없었지만 진행 중인 같은 요청에 합류한 경우를 기록."""
+        with self._lock:
+            self.coalesced += 1
+
+    def invalidate(self, key=None):
+        """key에 해당하는 값을 지웁니다. key가 없으면 전부 지웁니다."""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses,
+                    "coalesced": self.coalesced, "evictions": self.evictions}
+
+
+# ws.bus.go.kr 요청용 asyncio HTTP 클라이언트
+# 전용 스레드에서 이벤트 루프와 aiohttp 세션(keep-alive 커넥션 풀)을 계속 유지하며,
+# 동기 코드에서는 run()으로, 여러 요청을 동시에 보낼 때는 gather()로 사용
+class AsyncBusClient:
+    def __init__(self, timeout=5.0, retries=2, backoff=0.3, max_connections=8, cache_ttl=5.0, cache_size=256):
+        """
+        Parameters:
+            timeout (float): 요청 하나의 기본 제한 시간(초).
+            retries (int): 연결 오류/타임아웃/5xx 응답 시 재시도 횟수.
+            backoff (float): 재시도 간 대기 시간(초). 재시도마다 2배씩 늘어남.
+            max_connections (int): 동시에 열어둘 최대 커넥션 수.
+            cache_ttl (float): fetch_cached 응답을 재사용할 시간(초).
+            cache_size (int): fetch_cached 캐시에 보관할 최대 응답 수.
+        """
+        self.cache = TTLCache(ttl=cache_ttl, maxsize=cache_size)
+        self._inflight = {}  # key -> 진행 중인 요청 Task (이벤트 루프 스레드에서만 접근)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_connections = max_connections
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="bus-api-loop", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=30)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def fetch(self, url, params, timeout=None):
+        """GET 요청을 보내고 응답 본문(bytes)을 반환합니다."""
+        session = await self._get_session()
+        client_timeout = aiohttp.ClientTimeout(total=timeout or self.timeout)
+        for attempt in range(self.retries + 1):
+            try:
+                async with session.get(url, params=params, timeout=client_timeout) as response:
+                    if response.status >= 500:
+                        response.raise_for_status()
+                    return await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.retries:
+                    raise
+                print(f"Bus API request failed ({type(e).__name__}), retrying...")
+                await asyncio.sleep(self.backoff * (2 ** attempt))
+
+    async def fetch_cached(self, key, url, params, timeout=None):
+        """
+        fetch와 같지만, key에 대한 응답이 캐시에 있으면 네트워크 요청 없이 반환합니다.
+        같은 key로 이미 진행 중인 요청이 있으면 새로 보내지 않고 그 결과를 함께 기다립니다.
+        """
+        found, value = self.cache.get(key)
+        if found:
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.fetch(url, params, timeout))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_fetch_done(key, t))
+        else:
+            self.cache.record_coalesced()
+        # 기다리던 호출자 하나가 취소되어도 다른 호출자가 공유하는 요청은 계속 진행
+        return await asyncio.shield(task)
+
+    def _on_fetch_done(self, key, task):
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self.cache.set(key, task.result())
+
+    async def gather(self, coros):
+        """여러 요청을 동시에 실행. 실패한 요청은 결과 자리에 예외 객체가 들어감."""
+        return await asyncio.gather(*coros, return_exceptions=True)
+
+    def run(self, coro):
+        """코루틴을 클라이언트 이벤트 루프에서 실행하고 결과를 기다립니다 (동기 코드용)."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+
+    def close(self):
+        with self._lock:
+            loop = self._loop
+            self._loop = None
+        if loop is None:
+            return
+        if self._session is not None:
+            asyncio.run_coroutine_threadsafe(self._session.close(), loop).result()
+            self._session = None
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout=1.0)
+        loop.close()
+
+
+# 도착 정보 API 응답(XML)을 한 번만 훑어서 itemList 단위 레코드로 저장한 표
+# 버스 번호(busRouteAbrv)로 바로 찾을 수 있도록 색인을 만들어 둠
+class ArrivalTable:
+    HEADER_TAGS = ("headerCd", "headerMsg", "itemCount")
+
+    def __init__(self, records, header=None):
+        """
+        Parameters:
+            records (list): itemList 하나당 {태그: 텍스트} dict 리스트. 없는 태그는 get()에서 None.
+            header (dict): 응답 헤더(headerCd, headerMsg 등).
+        """
+        self.records = records
+        self.header = header or {}
+        self.by_route = {}
+        for i, record in enumerate(records):
+            route = record.get("busRouteAbrv")
+            if route is not None:
+                self.by_route.setdefault(route.strip(), i)
+
+    @classmethod
+    def from_xml(cls, content):
+        """응답 bytes를 iterparse로 한 번 훑어서 표를 만듭니다."""
+        records = []
+        header = {}
+        for _, elem in ET.iterparse(io.BytesIO(content), events=("end",)):
+            if elem.tag == "itemList":
+                records.append({child.tag: child.text for child in elem})
+                elem.clear()
+            elif elem.tag in cls.HEADER_TAGS:
+                header[elem.tag] = elem.text
+        return cls(records, header)
+
+    def __len__(self):
+        return len(self.records)
+
+    def index_of(self, bus_num):
+        """버스 번호에 해당하는 레코드 인덱스. 없으면 None."""
+        return self.by_route.get(str(bus_num).strip())
+
+    def find(self, bus_num):
+        """버스 번호에 해당하는 레코드(dict). 없으면 None."""
+        index = self.index_of(bus_num)
+        if index is None:
+            print(f"could not found the value {bus_num} in the arrival info")
+            return None
+        print(f"value {bus_num} found at index {index}")
+        return self.records[index]
+
+    def column(self, field):
+        """모든 레코드에서 field 값을 모은 리스트 (없는 태그는 None)."""
+        return [record.get(field) for record in self.records]
+
+    def fields(self, bus_num, *names):
+        """버스 번호에 해당하는 레코드에서 names 값들을 튜플로 반환. 레코드가 없으면 None."""
+        record = self.find(bus_num)
+        if record is None:
+            return None
+        return tuple(record.get(name) for name in names)
+
+
+# 도착 정보 레코드로 안내 문장 3개(도착 여부, 첫번째/두번째 버스 도착 예정시간)를
+# 고정 문구와 바뀌는 값(버스 번호, 도착 예정시간) 조각으로 나누어 만듦 (TTS 캐시에서 고정 문구 재사용)
+def arrival_message_fragments(bus_num, arrival):
+    # isArrive1 - 0: 운행중, 1: 도착
+    if arrival.get("isArrive1") == "1":
+        status = "번 버스가 도착했습니다."
+    else:
+        status = "번 버스가 도착하지 않았습니다."
+    return (
+        [str(bus_num), status],
+        ["첫번째 버스 도착 예정시간 :", arrival.get("arrmsg1") or ""],
+        ["두번째 버스 도착 예정시간 :", arrival.get("arrmsg2") or ""],
+    )
+
+
+# 도착 정보 레코드로 안내 문장 3개를 만듦
+def arrival_messages(bus_num, arrival):
+    return tuple("".join(parts) for parts in arrival_message_fragments(bus_num, arrival))
+
+
+# 정류소 스냅샷 저장 경로
+STATION_SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "station_snapshot")
+
+
+# station 테이블을 로컬 디스크에 열(column) 단위 .npy 파일로 저장해두는 스냅샷
+# 실행할 때마다 원격 DB에서 전체 테이블을 4번 가져오는 대신, 디스크의 파일을 메모리 매핑(mmap)으로 읽음
+# 스냅샷이 max_age보다 오래되었을 때만 DB에 버전(행 수 + 해시 또는 갱신 시각)을 확인하고 바뀐 경우에만 다시 받음
+class StationSnapshot:
+    COLUMNS = ("node_id", "station_name", "X_location", "Y_location")
+
+    def __init__(self, path=STATION_SNAPSHOT_DIR, max_age=24 * 3600, version_column=None, table="station", db=None):
+        """
+        Parameters:
+            path (str): 스냅샷 파일을 저장할 디렉터리.
+            max_age (float): 이 시간(초) 안에 확인한 스냅샷은 DB 확인 없이 그대로 사용.
+            version_column (str): 행의 갱신 시각/버전 column. 지정하면 바뀐 행만 증분으로 가져옴.
+            table (str): 정류소 테이블 이름.
+            db (DatabasePool): 갱신에 사용할 커넥션 풀. 없으면 새로 만듦.
+        """
+        self.db = db if db is not None else DatabasePool(maxconn=1)
+        self.path = path
+        self.max_age = max_age
+        self.version_column = version_column
+        self.table = table
+        self._meta = None
+        self._columns = {}
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @property
+    def meta(self):
+        if self._meta is None and os.path.exists(self._file("meta.json")):
+            with open(self._file("meta.json"), encoding="utf-8") as f:
+                self._meta = json.load(f)
+        return self._meta
+
+    def column(self, name):
+        """열 데이터를 처음 접근할 때 mmap으로 읽어옵니다."""
+        if name not in self._columns:
+            self._columns[name] = np.load(self._file(f"{name}.npy"), mmap_mode="r")
+        return self._columns[name]
+
+    @property
+    def node_id(self):
+        return self.column("node_id")
+
+    @property
+    def station_name(self):
+        return self.column("station_name")
+
+    @property
+    def X_location(self):
+        return self.column("X_location")
+
+    @property
+    def Y_location(self):
+        return self.column("Y_location")
+
+    def __len__(self):
+        return self.meta["count"] if self.meta else 0
+
+    def is_stale(self):
+        if self.meta is None:
+            return True
+        return time.time() - self.meta.get("checked_at", 0) > self.max_age
+
+    def ensure_fresh(self):
+        """스냅샷이 없거나 오래되었으면 갱신. DB 연결에 실패해도 기존 스냅샷이 있으면 그대로 사용."""
+        if not self.is_stale():
+            return self
+        try:
+            self.refresh()
+        except Exception as e:
+            if self.meta is None:
+                raise
+            print(f"Station snapshot refresh failed, using local snapshot: {str(e)}")
+        return self
+
+    def _remote_version(self, cursor):
+        if self.version_column:
+            cursor.execute(f"SELECT count(*), max({self.version_column})::text FROM {self.table};")
+        else:
+            # 갱신 시각 column이 없으면 서버에서 전체 행의 해시를 계산해 결과(수십 바이트)만 받음
+            cols = ", ".join(self.COLUMNS)
+            cursor.execute(
+                f"SELECT count(*), md5(string_agg(concat_ws('|', {cols}), ',' ORDER BY node_id)) FROM {self.table};"
+            )
+        count, version = cursor.fetchone()
+        return int(count), version
+
+    def refresh(self, force=False):
+        """
+        DB의 버전을 확인하고, 바뀌었으면 스냅샷을 갱신합니다.
+
+        Returns:
+            bool: 스냅샷 파일을 새로 썼으면 True.
+        """
+        rows, count, version = self.db.run(lambda conn: self._fetch_changes(conn, force))
+        if rows is None:
+            self.meta["checked_at"] = time.time()
+            self._write_meta(self.meta)
+            print("Station snapshot is up to date.")
+            return False
+
+        self._save(rows, count, version)
+        print(f"Station snapshot refreshed ({len(rows)} stations).")
+        return True
+
+    def _fetch_changes(self, conn, force):
+        """바뀐 것이 없으면 rows=None, 있으면 전체 행 리스트를 반환."""
+        with conn.cursor() as cursor:
+            count, version = self._remote_version(cursor)
+            meta = self.meta
+
+            if not force and meta and meta.get("version") == version and meta.get("count") == count:
+                return None, count, version
+
+            cols = ", ".join(self.COLUMNS)
+            rows = None
+            if not force and meta and self.version_column and meta.get("version") is not None:
+                # 증분 갱신: 마지막 버전 이후 바뀐 행만 가져와서 node_id 기준으로 병합
+                cursor.execute(
+                    f"SELECT {cols} FROM {self.table} WHERE {self.version_column} > %s;", (meta["version"],)
+                )
+                rows = self._merge(cursor.fetchall())
+                if len(rows) != count:
+                    rows = None  # 삭제된 행이 있으면 전체를 다시 받음
+
+            if rows is None:
+                cursor.execute(f"SELECT {cols} FROM {self.table} ORDER BY node_id;")
+                rows = cursor.fetchall()
+        return rows, count, version
+
+    def _merge(self, changed_rows):
+        merged = {}
+        for i in range(len(self)):
+            merged[str(self.node_id[i])] = (
+                str(self.node_id[i]), str(self.station_name[i]), float(self.X_location[i]), float(self.Y_location[i])
+            )
+        for row in changed_rows:
+            merged[str(row[0])] = row
+        return list(merged.values())
+
+    def _save(self, rows, count, version):
+        os.makedirs(self.path, exist_ok=True)
+        node_id, station_name, x, y = (zip(*rows) if rows else ((), (), (), ()))
+        arrays = {
+            "node_id": np.array([str(v) for v in node_id], dtype=str),
+            "station_name": np.array([str(v) if v is not None else "" for v in station_name], dtype=str),
+            "X_location": np.array([v if v is not None else np.nan for v in x], dtype=np.float64),
+            "Y_location": np.array([v if v is not None else np.nan for v in y], dtype=np.float64),
+        }
+        # 다른 프로세스가 읽는 중일 수 있으므로 임시 파일에 쓴 뒤 교체
+        self._columns = {}
+        for name, array in arrays.items():
+            tmp = self._file(f"{name}.tmp.npy")
+            np.save(tmp, array)
+            os.replace(tmp, self._file(f"{name}.npy"))
+        self._write_meta({"count": len(rows), "version": version, "checked_at": time.time()})
+
+    def _write_meta(self, meta):
+        os.makedirs(self.path, exist_ok=True)
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._file("meta.json"))
+        self._meta = meta
+
+
 class API():
-    def __init__(self):
-        pass
-            
+    def __init__(self, db_pool=None):
+        # DB 연결은 API가 소유한 커넥션 풀에서 재사용
+        self.db = db_pool if db_pool is not None else DatabasePool()
+        # 버스 번호 -> routeid 사전 (처음 조회할 때 한 번 읽어옴)
+        self.bus_routes = BusRouteMap(self.db)
+        # 버스 정보 API용 HTTP 클라이언트 (커넥션 재사용)
+        self.http = AsyncBusClient()
+
+        # 정류소 공간 인덱스 (build_station_index 또는 find_nearest_index 최초 호출 시 생성)
+        self.station_index = None
+        self._station_index_source = None  # 인덱스를 만든 (경도 리스트, 위도 리스트) 객체
+        self.stations = None
+        self._stations_key = None  # 현재 스냅샷 내용 (행 수, 버전)
+        self._stations_lock = threading.Lock()
+
+    def close(self):
+        """API가 가진 DB 연결을 모두 닫습니다."""
+        self.bus_routes.stop_auto_refresh()
+        self.http.close()
+        self.db.close()
+
+    def resolve_bus_route(self, bus_num):
+        """버스 번호의 routeid를 메모리 사전에서 찾습니다. 없으면 None."""
+        routeid = self.bus_routes.resolve(bus_num)
+        if routeid is not None:
+            print("queryed value : ", routeid)
+        else:
+            print("No value found with the given value")
+        return routeid
+
+    def load_station_snapshot(self, **kwargs):
+        """
+        로컬 정류소 스냅샷을 열고(필요하면 갱신) 좌표로 공간 인덱스를 만듭니다.
+        이미 열어둔 스냅샷과 인덱스는 재사용하고, 스냅샷 내용이 바뀐 경우에만 인덱스를 다시 만듦.
+        """
+        with self._stations_lock:
+            if self.stations is None or kwargs:
+                kwargs.setdefault("db", self.db)
+                self.stations = StationSnapshot(**kwargs)
+            self.stations.ensure_fresh()
+
+            meta = self.stations.meta or {}
+            key = (meta.get("count"), meta.get("version"))
+            if key != self._stations_key or self.station_index is None:
+                self.build_station_index(self.stations.X_location, self.stations.Y_location)
+                self._stations_key = key
+            return self.stations
+
+    def build_station_index(self, x_list, y_list):
+        """
+        정류소 경도/위도 리스트로 StationIndex를 만들어 저장하고 반환합니다.
+        리스트 내용을 제자리에서 바꾼 경우에는 이 함수를 다시 호출해야 인덱스에 반영됨.
+        """
+        self.station_index = StationIndex(x_list, y_list)
+        self._station_index_source = (x_list, y_list)
+        return self.station_index
+
+    def _station_index_built_from(self, x_list, y_list):
+        # id()는 객체가 사라지면 재사용될 수 있으므로 리스트 객체 자체를 들고 있다가 is로 비교
+        source = self._station_index_source
+        return source is not None and source[0] is x_list and source[1] is y_list
+
     def database_query(self, table, key1, key2, val):
         """
         지정된 테이블에서 키와 값을 기준으로 데이터를 조회합니다.
@@ -131,23 +1304,13 @@ class API():
         Raises:
             DatabaseError: 데이터베이스 조회 중 오류가 발생한 경우.
         """
-        #데이터베이스에 연결시도
-        try:
-            # 데이터베이스 연결 & 커넥트 객체 생성
-            conn = psycopg2.connect(host="122.44.85.37", dbname="postgres", user="postgres", password="postgres", port='5432')
-        except:
-            print("Not Connected!.")
-
-        # 쿼리를 수행하는 cursor객체 생성
-        cursor = conn.cursor()
-
-        # 쿼리문
-        sql_query = f"SELECT {key1} FROM {table} WHERE {key2} = %s;"
-
-        # 쿼리실행
-        cursor.execute(sql_query, (val,))
-        #fetchone은 쿼리에 해당하는 열을 튜플형태로 반환, 없다면 None
-        query_result = cursor.fetchone()
+        if (table, key1, key2) == ("bus", "routeid", "bus_id"):
+            # 가장 자주 쓰는 버스 번호 -> routeid 조회는 서버 측 prepared statement로 실행
+            query_result = self.db.execute_prepared("bus_routeid", (val,))
+        else:
+            sql_query = f"SELECT {key1} FROM {table} WHERE {key2} = %s;"
+            #fetchone은 쿼리에 해당하는 열을 튜플형태로 반환, 없다면 None
+            query_result = self.db.fetchone(sql_query, (val,))
 
         # 예외 처리
         if query_result:
@@ -155,9 +1318,6 @@ class API():
         else:
             print("No value found with the given value")
 
-
-        # 데이터베이스 연결 끊기
-        conn.close()
         return query_result
     
     def database_query_specific_column(self, table, column_name):
@@ -175,19 +1335,9 @@ class API():
             Exception: 데이터베이스 연결 실패 또는 쿼리 실행 중 오류 발생 시 예외 발생.
         """
         try:
-            # 데이터베이스 연결
-            conn = psycopg2.connect(host="122.44.85.37", dbname="postgres", user="postgres", password="postgres",port='5432')
-            cursor = conn.cursor()
-
             # SQL 쿼리 실행 (주의: column_name을 쿼리에 직접 포함시킬 때 SQL 인젝션 위험이 있으므로 신뢰할 수 있는 입력만 처리해야 함)
             sql_query = f"SELECT {column_name} FROM {table};"
-            cursor.execute(sql_query)
-
-            # 결과 모두 가져오기
-            results = cursor.fetchall()
-
-            # 연결 종료
-            conn.close()
+            results = self.db.fetchall(sql_query)
 
             if results:
                 print(f"successfully queried a column named {column_name}")
@@ -199,75 +1349,136 @@ class API():
         except Exception as e:
             print(f"Database error: {str(e)}")
             raise
-    def find_nearest_index(self, x_coord, y_coord, x_list, y_list):
-        # x_list와 y_list를 NumPy 배열로 변환
-        x_array = np.array(x_list)
-        y_array = np.array(y_list)
 
-        # 주어진 x_coord, y_coord와 각 좌표 간의 거리 계산
-        distances = np.sqrt((x_array - x_coord)**2 + (y_array - y_coord)**2)
+    def database_query_columns(self, table, columns, key=None, values=None):
+        """
+        여러 column을 한 번의 쿼리로 조회합니다. key와 values를 주면 해당 값들에 해당하는 행만 조회합니다.
 
-        # 가장 작은 거리의 인덱스 반환
-        nearest_index = np.argmin(distances)
+        Parameters:
+            table (str): 조회할 table의 이름.
+            columns (list): 가져올 column 이름들.
+            key (str): 검색 기준 column. 없으면 전체 행 조회.
+            values (list): key column에서 찾을 값들.
+
+        Returns:
+            list: 조회된 행(튜플)의 리스트.
+        """
+        cols = ", ".join(columns)
+        if key is None:
+            return self.db.fetchall(f"SELECT {cols} FROM {table};")
+        values = tuple(values or ())
+        if not values:
+            return []
+        return self.db.fetchall(f"SELECT {cols} FROM {table} WHERE {key} IN %s;", (values,))
+
+    def database_query_many(self, table, key1, key2, values):
+        """
+        database_query의 여러 값 버전. 한 번의 쿼리로 values 전체를 조회합니다.
+
+        Parameters:
+            table (str): 조회할 table의 이름.
+            key1 (str or list): 리턴받고자 하는 column (여러 개 가능).
+            key2 (str): 검색할 value가 해당하는 column.
+            values (list): 조회 기준이 될 값들.
+
+        Returns:
+            dict: {str(value): 조회된 행(튜플)}. 찾지 못한 값은 포함되지 않음.
+        """
+        key1 = [key1] if isinstance(key1, str) else list(key1)
+        rows = self.database_query_columns(table, [key2] + key1, key2, values)
+        return {str(row[0]): row[1:] for row in rows}
+
+    def find_nearest_index(self, x_coord, y_coord, x_list=None, y_list=None):
+        # 같은 좌표 리스트로 이미 만든 인덱스가 있으면 재사용, 없거나 리스트가 바뀌었으면 새로 생성
+        if x_list is not None and not self._station_index_built_from(x_list, y_list):
+            self.build_station_index(x_list, y_list)
+        if self.station_index is None:
+            raise ValueError("station index is not built. pass x_list/y_list or call build_station_index first.")
+
+        # 하버사인 거리 기준으로 가장 가까운 정류소 인덱스 반환
+        nearest = self.station_index.nearest(x_coord, y_coord, k=1)
+        if not nearest:
+            return None
+        nearest_index, distance = nearest[0]
+        print(f"nearest station index : {nearest_index}, distance : {distance:.1f}m")
         return nearest_index
 
-    # 특정 정류장의 정보(그 정류장에서 운행하는 버스들, 도착정보)
-    def station_bus_list(self, station_result):
-        url = 'http://ws.bus.go.kr/api/rest/arrive/getLowArrInfoByStId'
-        service_key = "lnGvRUsSrOgezp/xjHmRf1XJipLQd9ANFdkUk5w2kB1FaTDTAcS88zmKBViC6HYFRcWfhGjkuNQD85aNrvoTTw=="
+    # 좌표 기반 반경 내 정류소 조회 (station_pose의 오프라인 버전, 네트워크 요청 없음)
+    def station_pose_local(self, X_location, Y_location, radius):
+        """
+        build_station_index로 만든 인덱스에서 반경 radius(m) 이내 정류소를 찾습니다.
 
-        params ={'serviceKey' : service_key,
-                'stId' : str(station_result) }
+        Returns:
+            list: (정류소 인덱스, 거리[m]) 튜플의 리스트. 거리 오름차순.
+        """
+        if self.station_index is None:
+            raise ValueError("station index is not built. call build_station_index first.")
+        return self.station_index.within_radius(float(X_location), float(Y_location), float(radius))
+
+    def _bus_api_params(self, **params):
+        params = {key: str(val) for key, val in params.items()}
+        params["serviceKey"] = BUS_API_SERVICE_KEY
+        return params
 
-        response = requests.get(url, params=params)
-        return response.content
+    # 특정 정류장의 정보(그 정류장에서 운행하는 버스들, 도착정보)
+    async def station_bus_list_async(self, station_result, timeout=None):
+        # 도착 정보는 몇 초 동안 유효하므로 정류소 id 기준으로 캐시
+        params = self._bus_api_params(stId=station_result)
+        key = ("station_bus_list", str(station_result))
+        return await self.http.fetch_cached(key, BUS_API_ENDPOINTS["station_bus_list"], params, timeout)
 
     #  특정 버스 노선이 경유하는 버스 정류소의 정보
-    def bus_station_list(self, bus_result):
-        url = 'http://ws.bus.go.kr/api/rest/busRouteInfo/getStaionByRoute'
-        service_key = 'lnGvRUsSrOgezp/xjHmRf1XJipLQd9ANFdkUk5w2kB1FaTDTAcS88zmKBViC6HYFRcWfhGjkuNQD85aNrvoTTw=='
+    async def bus_station_list_async(self, bus_result, timeout=None):
+        params = self._bus_api_params(busRouteId=bus_result)
+        return await self.http.fetch(BUS_API_ENDPOINTS["bus_station_list"], params, timeout)
 
-        params ={'serviceKey' : service_key,
-                'busRouteId' : str(bus_result) }
+    # 정류소 노선별 교통약자 도착예정정보
+    async def station_arrival_info_async(self, station_result, bus_result, ord, timeout=None):
+        params = self._bus_api_params(stId=station_result, busRouteId=bus_result, ord=ord)
+        key = ("station_arrival_info", str(station_result), str(bus_result), str(ord))
+        return await self.http.fetch_cached(key, BUS_API_ENDPOINTS["station_arrival_info"], params, timeout)
 
-        response = requests.get(url, params=params)
-        return response.content
+    #  좌표기반 버스정류장 위치 조회
+    async def station_pose_async(self, X_location, Y_location, radius, timeout=None):
+        params = self._bus_api_params(tmX=X_location, tmY=Y_location, radius=radius)
+        return await self.http.fetch(BUS_API_ENDPOINTS["station_pose"], params, timeout)
 
+    # 동기 버전 (main.py, stts.py에서 사용)
+    def station_bus_list(self, station_result, timeout=None):
+        return self.http.run(self.station_bus_list_async(station_result, timeout))
 
-    # 정류소 노선별 교통약자 도착예정정보
-    def station_arrival_info(self, station_result, bus_result, ord):
-        url = 'http://ws.bus.go.kr/api/rest/arrive/getLowArrInfoByRoute'
-        service_key = 'lnGvRUsSrOgezp/xjHmRf1XJipLQd9ANFdkUk5w2kB1FaTDTAcS88zmKBViC6HYFRcWfhGjkuNQD85aNrvoTTw=='
+    def bus_station_list(self, bus_result, timeout=None):
+        return self.http.run(self.bus_station_list_async(bus_result, timeout))
 
+    def station_arrival_info(self, station_result, bus_result, ord, timeout=None):
+        return self.http.run(self.station_arrival_info_async(station_result, bus_result, ord, timeout))
 
+    def station_pose(self, X_location, Y_location, radius, timeout=None):
+        return self.http.run(self.station_pose_async(X_location, Y_location, radius, timeout))
 
-        params ={'serviceKey' : service_key,
-                'stId' : str(station_result),
-                'busRouteId' : str(bus_result),
-                'ord' : str(ord) }
+    def fetch_concurrently(self, *coros):
+        """
+        *_async 메서드로 만든 요청들을 동시에 보내고 결과를 같은 순서로 반환합니다.
+        EX) api.fetch_concurrently(api.station_bus_list_async(a), api.bus_station_list_async(b))
 
-        response = requests.get(url, params=params)
-        return response.content
-    
-        #  좌표기반 버스정류장 위치 조회
-    def station_pose(self, X_location, Y_location, radius):
-        url = 'http://ws.bus.go.kr/api/rest/busRouteInfo/getStaionByRoute'
-        service_key = 'lnGvRUsSrOgezp/xjHmRf1XJipLQd9ANFdkUk5w2kB1FaTDTAcS88zmKBViC6HYFRcWfhGjkuNQD85aNrvoTTw=='
+        Returns:
+            list: 응답 본문(bytes) 또는 실패한 요청의 예외 객체.
+        """
+        return self.http.run(self.http.gather(coros))
 
-        params ={'serviceKey' : service_key,
-                'tmX' : str(X_location),
-                'tmY' : str(Y_location),
-                'radius' : str(radius)
-                }
+    def station_bus_lists(self, station_results, timeout=None):
+        """여러 정류소의 도착 정보를 동시에 조회합니다."""
+        return self.fetch_concurrently(*[self.station_bus_list_async(st, timeout) for st in station_results])
 
-        response = requests.get(url, params=params)
-        return response.content
+    # 도착 정보 응답을 한 번 파싱해서 버스 번호로 찾을 수 있는 ArrivalTable로 반환
+    def parse_arrival_info(self, content):
+        return ArrivalTable.from_xml(content)
 
     # xml 값에서 특정 val라는 tag안에 있는 item을 가져오는 함수
     def find_xml_val(self, root, val):
         item_list = []
         for item in root.findall(".//itemList"):
-            item1 = item.find(str(val)).text  # val에 해당하는 태그의 텍스트 내용을 가져옵니다.
+            item1 = item.findtext(str(val))  # val에 해당하는 태그의 텍스트 내용을 가져옵니다. 태그가 없으면 None
             item_list.append(item1)
         return item_list
 
@@ -281,10 +1492,288 @@ class API():
         return None, False
     
 
+# OCR 전에 번호판 크롭을 싸게 평가해서 나쁜 크롭(흐림, 너무 작음, 노출 과다/부족)을 걸러내는 단계
+# 통과한 크롭 중 점수가 높은 top_k개만 전처리와 OCR로 보냄
+class CropQualityGate:
+    def __init__(self, min_sharpness=60.0, min_area=900, max_clipped=0.35, top_k=4):
+        """
+        Parameters:
+            min_sharpness (float): 라플라시안 분산(선명도)의 최솟값.
+            min_area (int): 크롭 면적(px)의 최솟값.
+            max_clipped (float): 거의 검거나(<=5) 거의 흰(>=250) 픽셀 비율의 최댓값.
+            top_k (int): 한 창(window)에서 OCR로 보낼 최대 크롭 수. None이면 제한 없음.
+        """
+        self.min_sharpness = min_sharpness
+        self.min_area = min_area
+        self.max_clipped = max_clipped
+        self.top_k = top_k
+        self.accepted = 0
+        self.dropped = 0             # 통과했지만 top_k 밖이라 OCR하지 않은 크롭 수
+        self.rejections = Counter()  # 거절 이유별 크롭 수 ("small", "blurry", "exposure")
+
+    def measure(self, plate_image):
+        """크롭의 면적, 선명도(라플라시안 분산), 클리핑 비율을 계산."""
+        gray = cv2.cvtColor(plate_image, cv2.COLOR_BGR2GRAY) if plate_image.ndim == 3 else plate_image
+        sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+        clipped = float(np.count_nonzero((gray <= 5) | (gray >= 250))) / gray.size
+        return {"area": gray.size, "sharpness": sharpness, "clipped": clipped}
+
+    def evaluate(self, plate_image):
+        """
+        크롭의 품질 점수를 반환합니다. 기준을 통과하지 못하면 거절 이유를 기록하고 None을 반환.
+        점수는 기준값 대비 선명도와 면적(각각 최대 4배까지)에 노출 정상 비율을 곱한 값.
+        """
+        metrics = self.measure(plate_image)
+        if metrics["area"] < self.min_area:
+            reason = "small"
+        elif metrics["sharpness"] < self.min_sharpness:
+            reason = "blurry"
+        elif metrics["clipped"] > self.max_clipped:
+            reason = "exposure"
+        else:
+            self.accepted += 1
+            return (min(metrics["sharpness"] / self.min_sharpness, 4.0)
+                    * min(metrics["area"] / self.min_area, 4.0)
+                    * (1.0 - metrics["clipped"]))
+        self.rejections[reason] += 1
+        return None
+
+    def best(self, candidates):
+        """(크롭, 점수, ...) 후보들 중 점수가 높은 top_k개를 반환."""
+        ranked = sorted(candidates, key=lambda candidate: candidate[1], reverse=True)
+        if self.top_k is None or len(ranked) <= self.top_k:
+            return ranked
+        self.dropped += len(ranked) - self.top_k
+        return ranked[:self.top_k]
+
+    def stats(self):
+        return {"accepted": self.accepted, "dropped": self.dropped, "rejected": dict(self.rejections)}
+
+    def reset_stats(self):
+        self.accepted = 0
+        self.dropped = 0
+        self.rejections = Counter()
+
+
+# 인식된 번호들의 표와 신뢰도를 모아서, 결론을 내려도 되는지(조기 종료) 판단
+# 결론 조건: 1등과 2등의 표 차이가 min_margin 이상이고,
+# 1등의 평균 신뢰도가 strong_confidence 이상이거나 1등의 표가 min_votes 이상
+class PlateVote:
+    def __init__(self, min_margin=1, min_votes=2, strong_confidence=0.9):
+        self.min_margin = min_margin
+        self.min_votes = min_votes
+        self.strong_confidence = strong_confidence
+        self.votes = Counter()
+        self.confidence_sum = Counter()
+
+    def add(self, readings):
+        """(번호, 신뢰도) 리스트를 표에 더합니다."""
+        for text, confidence in readings:
+            self.votes[text] += 1
+            self.confidence_sum[text] += confidence
+
+    def leader(self):
+        """지금까지 가장 많이 인식된 번호 (없으면 None)."""
+        return self.votes.most_common(1)[0][0] if self.votes else None
+
+    def decided(self):
+        """결론 조건을 만족하면 1등 번호, 아니면 None."""
+        if not self.votes:
+            return None
+        ranked = self.votes.most_common(2)
+        leader, leader_votes = ranked[0]
+        margin = leader_votes - (ranked[1][1] if len(ranked) > 1 else 0)
+        mean_confidence = self.confidence_sum[leader] / leader_votes
+        if margin >= self.min_margin and (mean_confidence >= self.strong_confidence or leader_votes >= self.min_votes):
+            print(f"Decided : {leader} (votes {leader_votes}, margin {margin}, confidence {mean_confidence:.2f})")
+            return leader
+        return None
+
+
+# 추적 중인 번호판 하나의 상태 (위치, OCR 횟수, 지금까지의 최고 크롭 품질, 누적 투표)
+class PlateTrack:
+    def __init__(self, track_id, bbox, frame_no):
+        self.track_id = track_id
+        self.bbox = bbox
+        self.first_seen = frame_no
+        self.last_seen = frame_no
+        self.hits = 1
+        self.ocr_calls = 0
+        self.best_quality = 0.0
+        self.votes = Counter()
+
+
+# 프레임 사이에서 같은 번호판(YOLO 박스)을 IoU/중심점 거리로 이어주는 가벼운 추적기
+# 번호판마다 track id를 붙여서, 번호가 확인되기 전이거나 더 좋은 크롭이 나왔을 때만 OCR을 실행하게 함
+class PlateTracker:
+    def __init__(self, iou_threshold=0.3, max_center_distance=0.5, max_missed=15, improve_ratio=1.2, settle_votes=2):
+        """
+        Parameters:
+            iou_threshold (float): 이 값 이상 겹치면 같은 번호판으로 봄.
+            max_center_distance (float): IoU가 낮아도 중심점 거리가 (track 박스 대각선 x 이 값) 이하면 같은 번호판으로 봄.
+            max_missed (int): 이 프레임 수 동안 보이지 않으면 track 삭제.
+            improve_ratio (float): 크롭 품질이 지금까지 최고의 몇 배 이상일 때 OCR을 다시 실행할지.
+            settle_votes (int): 한 track에서 같은 번호가 이 횟수만큼 읽힐 때까지는 창(window)마다 OCR을 다시 실행.
+                                PlateVote의 min_votes와 맞춰서, 한 번 읽힌 번호판이 조기 종료 조건에 닿을 수 있게 함.
+        """
+        self.iou_threshold = iou_threshold
+        self.max_center_distance = max_center_distance
+        self.max_missed = max_missed
+        self.improve_ratio = improve_ratio
+        self.settle_votes = settle_votes
+        self.tracks = {}
+        self.frame_no = 0
+        self._next_id = 1
+
+    @staticmethod
+    def iou(a, b):
+        ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+        ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+        inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+        union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+        return inter / union if union > 0 else 0.0
+
+    def _match_score(self, track_bbox, bbox):
+        score = self.iou(track_bbox, bbox)
+        if score >= self.iou_threshold:
+            return score
+        # 빠르게 움직여서 겹치지 않는 경우 중심점 거리로 다시 확인 (IoU 매칭보다 낮은 점수)
+        tcx, tcy = (track_bbox[0] + track_bbox[2]) / 2, (track_bbox[1] + track_bbox[3]) / 2
+        bcx, bcy = (bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2
+        diag = np.hypot(track_bbox[2] - track_bbox[0], track_bbox[3] - track_bbox[1])
+        distance = np.hypot(tcx - bcx, tcy - bcy)
+        if diag > 0 and distance <= self.max_center_distance * diag:
+            return self.iou_threshold * (1.0 - distance / (self.max_center_distance * diag)) * 0.5
+        return None
+
+    def update(self, bboxes):
+        """
+        한 프레임의 번호판 박스들을 기존 track에 매칭합니다. 검출이 없는 프레임도 빈 리스트로 호출해야 함.
+
+        Returns:
+            list: bboxes와 같은 순서의 PlateTrack 리스트 (새 번호판이면 새 track).
+        """
+        self.frame_no += 1
+
+        # 모든 (track, 박스) 쌍의 점수를 계산하고 점수가 높은 쌍부터 greedy 매칭
+        pairs = []
+        for track_id, track in self.tracks.items():
+            for j, bbox in enumerate(bboxes):
+                score = self._match_score(track.bbox, bbox)
+                if score is not None:
+                    pairs.append((score, track_id, j))
+        pairs.sort(reverse=True)
+
+        assigned = [None] * len(bboxes)
+        used_tracks = set()
+        for _, track_id, j in pairs:
+            if track_id in used_tracks or assigned[j] is not None:
+                continue
+            track = self.tracks[track_id]
+            track.bbox = bboxes[j]
+            track.last_seen = self.frame_no
+            track.hits += 1
+            assigned[j] = track
+            used_tracks.add(track_id)
+
+        for j, bbox in enumerate(bboxes):
+            if assigned[j] is None:
+                track = PlateTrack(self._next_id, bbox, self.frame_no)
+                self.tracks[track.track_id] = track
+                self._next_id += 1
+                assigned[j] = track
+
+        # 오래 보이지 않은 track 삭제
+        for track_id in [tid for tid, t in self.tracks.items() if self.frame_no - t.last_seen > self.max_missed]:
+            del self.tracks[track_id]
+
+        return assigned
+
+    def settled(self, track):
+        """같은 번호가 settle_votes번 이상 읽힌 track인지 여부."""
+        return max(track.votes.values(), default=0) >= self.settle_votes
+
+    def needs_ocr(self, track, quality):
+        """번호가 아직 확인되지 않은 번호판이거나 크롭 품질이 충분히 좋아졌을 때만 OCR이 필요."""
+        return not self.settled(track) or quality > track.best_quality * self.improve_ratio
+
+    def record(self, track, quality, readings):
+        """OCR 결과(번호 리스트)를 track의 누적 투표에 더합니다."""
+        track.ocr_calls += 1
+        track.best_quality = max(track.best_quality, quality)
+        track.votes.update(readings)
+
+    def vote(self, tracks=None):
+        """tracks(없으면 살아있는 모든 track)의 누적 투표를 합친 Counter."""
+        total = Counter()
+        for track in (self.tracks.values() if tracks is None else tracks):
+            total.update(track.votes)
+        return total
+
+    def reset(self):
+        self.tracks = {}
+        self.frame_no = 0
+
+
+# 처리 단계별(YOLO, 크롭, 전처리, OCR ...) 걸린 시간과 횟수를 모으는 측정기
+# FrameProcessor에 timer로 넘기면 단계마다 시간을 더하고, count로 OCR 호출 수 같은 값을 셈
+class StageTimer:
+    def __init__(self):
+        self.totals = Counter()    # 단계 이름 -> 걸린 시간 합계(초)
+        self.calls = Counter()     # 단계 이름 -> 측정 횟수
+        self.counters = Counter()  # 이름 -> 누적 개수
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.totals[stage] += elapsed
+                self.calls[stage] += 1
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def reset(self):
+        with self._lock:
+            self.totals.clear()
+            self.calls.clear()
+            self.counters.clear()
+
+    def summary(self):
+        """단계별 {total_s, calls, mean_ms}와 누적 개수를 dict로 반환."""
+        with self._lock:
+            stages = {stage: {"total_s": total, "calls": self.calls[stage],
+                              "mean_ms": 1000.0 * total / self.calls[stage]}
+                      for stage, total in self.totals.items()}
+            return {"stages": stages, "counters": dict(self.counters)}
+
+
 # 프레임을 처리하여 번호판을 인식하고, 인식된 번호를 데이터베이스에서 조회하는 기능을 제공
 # YOLO 모델을 사용하여 번호판을 감지하고, EasyOCR을 사용하여 번호판의 텍스트를 인식
 class FrameProcessor:
-    def __init__(self, model, plate_class_indices, reader, width, height, padding, min_confidence):
+    # batch OCR 시 모든 번호판 이미지를 맞출 높이(px)
+    OCR_HEIGHT = 64
+
+    # 인식기 전용 모드에서 번호판 이미지 중 인식할 고정 영역 (x 시작, x 끝, y 시작, y 끝 비율)
+    DEFAULT_SUB_REGIONS = ((0.0, 1.0, 0.0, 1.0),)
+
+    def __init__(self, model, plate_class_indices, reader, width, height, padding, min_confidence,
+                 ocr_mode="readtext", sub_regions=None, tracker=None, quality_gate=None, timer=None):
+        """
+        Parameters:
+            ocr_mode (str): "readtext"는 EasyOCR의 텍스트 검출(CRAFT) + 인식을 모두 실행,
+                            "recognize"는 YOLO가 찾은 번호판 영역을 바로 인식기에 넣음 (숫자만 허용).
+            sub_regions (list): "recognize" 모드에서 번호판마다 인식할 영역 비율 목록. 없으면 번호판 전체.
+            tracker (PlateTracker): 주면 프레임 사이에서 번호판을 추적해 번호판마다 한 번(또는 크롭이 좋아졌을 때만) OCR.
+            quality_gate (CropQualityGate): 주면 OCR 전에 나쁜 크롭을 거르고 점수가 높은 크롭만 OCR.
+            timer (StageTimer): 주면 단계별(yolo, crop, preprocess, ocr) 시간과 OCR 호출 수를 기록.
+        """
         self.model = model
         self.plate_class_indices = plate_class_indices
         self.reader = reader
@@ -292,6 +1781,11 @@ class FrameProcessor:
         self.height = height
         self.padding = padding
         self.min_confidence = min_confidence
+        self.ocr_mode = ocr_mode
+        self.sub_regions = tuple(sub_regions) if sub_regions else self.DEFAULT_SUB_REGIONS
+        self.tracker = tracker
+        self.quality_gate = quality_gate
+        self.timer = timer
         self.processed_numbers = set()
 
         # # 경로 설정
@@ -302,6 +1796,12 @@ class FrameProcessor:
         # self.clear_directory(self.plate_img_dir)
         # self.clear_directory(self.preprocessed_img_dir)
 
+    def reset(self):
+        """이전 요청의 추적/인식 상태를 지움 (모델과 OCR reader는 그대로 유지)."""
+        self.processed_numbers = set()
+        if self.tracker is not None:
+            self.tracker.reset()
+
     def clear_directory(self, directory):
         """디렉터리 내의 모든 파일을 삭제"""
         if os.path.exists(directory):
@@ -315,12 +1815,26 @@ class FrameProcessor:
         else:
             os.makedirs(directory, exist_ok=True)
 
-    def process_frame(self, frames):
-        ocr_results = []
+    def _timed(self, stage):
+        return self.timer.measure(stage) if self.timer is not None else contextlib.nullcontext()
+
+    def detect(self, frames):
+        """모든 프레임을 YOLO 모델에 한 번에(batch) 넣어 검출하고, 프레임별 결과 리스트를 반환."""
+        if not frames:
+            return []
+        with self._timed("yolo"):
+            return list(self.model(list(frames)))
+
+    def extract_plate_crops(self, frames, detections):
+        """
+        검출 결과에서 번호판 클래스 영역을 padding을 더해 잘라냅니다.
 
-        for frame_idx, frame in enumerate(frames):
-            results = self.model(frame)
-            boxes = results[0].boxes if len(results) > 0 else []
+        Returns:
+            list: (frame_idx, box_idx, (x1, y1, x2, y2), 잘라낸 이미지) 튜플의 리스트.
+        """
+        crops = []
+        for frame_idx, (frame, result) in enumerate(zip(frames, detections)):
+            boxes = result.boxes if result is not None else []
 
             if not boxes:
                 print("No boxes detected by YOLO model.")
@@ -336,40 +1850,478 @@ class FrameProcessor:
                     plate_image = frame[y1:y2, x1:x2]
                     if plate_image.size == 0:
                         print(f"Skipped empty plate image at frame {frame_idx}, box {box_idx}")
-                        continue    
-
-                    preprocessed_img = ImageProcessor.preprocess_image(plate_image)
-                         
-
-                    ocr_result = self.reader.readtext(preprocessed_img, detail=1)
-
-                    if not ocr_result:
-                        print(f"No OCR results for frame {frame_idx}, box {box_idx}")
-                    else:
-                        for res in ocr_result:
-                            text, confidence = res[1], res[2]
-                            # print(f"OCR detected text: {text}, Confidence: {confidence}")
-                            if confidence >= self.min_confidence:
-                                text = ''.join(filter(str.isdigit, text))
-                                if 2 <= len(text) <= 4:
-                                    ocr_results.append(text)
-
-        if ocr_results:
-            most_common_text = Counter(ocr_results).most_common(1)[0][0]
+                        continue
+
+                    crops.append((frame_idx, box_idx, (x1, y1, x2, y2), plate_image))
+        return crops
+
+    def crop_quality(self, plate_image):
+        """번호판 크롭의 품질 점수 (클수록 좋음). 품질 게이트가 있으면 게이트 점수(거절 시 None), 없으면 크롭 면적."""
+        if self.quality_gate is not None:
+            return self.quality_gate.evaluate(plate_image)
+        return float(plate_image.shape[0] * plate_image.shape[1])
+
+    def _select_tracked_crops(self, num_frames, candidates):
+        """
+        후보 (크롭, 품질)들을 프레임 순서대로 추적기에 넣고, OCR이 필요한 track마다 이번 창에서 가장 좋은 크롭 하나만 고릅니다.
+        품질이 None(게이트에서 거절)인 크롭도 추적에는 사용하지만 OCR 대상은 되지 않습니다.
+
+        Returns:
+            tuple: ((크롭, 품질, track) 리스트, 이번 창에서 보인 track 리스트)
+        """
+        by_frame = {}
+        for crop, quality in candidates:
+            by_frame.setdefault(crop[0], []).append((crop, quality))
+
+        best = {}    # track_id -> (크롭, 품질, track)
+        active = {}  # track_id -> track
+        for frame_idx in range(num_frames):
+            frame_candidates = by_frame.get(frame_idx, [])
+            frame_tracks = self.tracker.update([crop[2] for crop, _ in frame_candidates])
+            for (crop, quality), track in zip(frame_candidates, frame_tracks):
+                active[track.track_id] = track
+                if quality is None or not self.tracker.needs_ocr(track, quality):
+                    continue
+                if track.track_id not in best or quality > best[track.track_id][1]:
+                    best[track.track_id] = (crop, quality, track)
+
+        selected = list(best.values())
+        print(f"Tracked plates : {len(active)}, plate crops : {len(candidates)}, new or improved : {len(selected)}")
+        return selected, list(active.values())
+
+    def _resize_to_common_height(self, images):
+        """
+        이미지들을 OCR_HEIGHT 높이로 맞추고, 가장 넓은 이미지 폭에 맞춰 오른쪽을 배경값(0)으로 채움.
+        이진화된 이미지를 테두리 값으로 채우면 끝 열이 흰 테두리에 걸친 경우 긴 막대가 생겨 글자로 검출될 수 있음.
+
+        Returns:
+            tuple: (채운 이미지 리스트, 채우기 전 이미지별 폭 리스트)
+        """
+        resized = []
+        for img in images:
+            h, w = img.shape[:2]
+            new_w = max(1, int(round(w * self.OCR_HEIGHT / h)))
+            interpolation = cv2.INTER_AREA if h > self.OCR_HEIGHT else cv2.INTER_CUBIC
+            resized.append(cv2.resize(img, (new_w, self.OCR_HEIGHT), interpolation=interpolation))
+        widths = [img.shape[1] for img in resized]
+        max_w = max(widths)
+        padded = [cv2.copyMakeBorder(img, 0, 0, 0, max_w - img.shape[1], cv2.BORDER_CONSTANT, value=0) for img in resized]
+        return padded, widths
+
+    def recognize_crops(self, images):
+        """
+        전처리된 번호판 이미지들을 같은 크기로 맞춰 EasyOCR에 한 번에 넣습니다.
+
+        Returns:
+            list: 이미지별 readtext(detail=1) 결과 리스트 (입력과 같은 순서).
+        """
+        if not images:
+            return []
+        batch, widths = self._resize_to_common_height(images)
+        batched = self.ocr_mode == "recognize" or hasattr(self.reader, "readtext_batched")
+        if self.timer is not None:
+            self.timer.count("ocr_calls", 1 if batched else len(batch))
+        if self.ocr_mode == "recognize":
+            return self._recognize_only(batch, widths)
+        if hasattr(self.reader, "readtext_batched"):
+            return self.reader.readtext_batched(batch, detail=1, batch_size=len(batch))
+        return [self.reader.readtext(img, detail=1) for img in batch]
+
+    def _recognize_only(self, batch, widths):
+        """
+        텍스트 검출 없이 인식기만 실행합니다.
+        같은 크기로 맞춘 번호판 이미지들을 세로로 이어 붙이고, 각 번호판의 sub_regions를
+        horizontal_list 박스로 넘겨 한 번의 recognize 호출로 모두 인식합니다.
+        박스 폭은 채우기 전 번호판 폭(widths) 기준이라 오른쪽에 채운 부분은 인식기에 들어가지 않음.
+        """
+        crop_h = batch[0].shape[0]
+        canvas = np.vstack(batch)
+
+        boxes = []
+        for i, crop_w in enumerate(widths):
+            for x0, x1, y0, y1 in self.sub_regions:
+                boxes.append([int(x0 * crop_w), int(x1 * crop_w),
+                              i * crop_h + int(y0 * crop_h), i * crop_h + int(y1 * crop_h)])
+
+        recognized = self.reader.recognize(
+            canvas, horizontal_list=boxes, free_list=[],
+            allowlist="0123456789", detail=1, batch_size=len(boxes),
+        )
+
+        # 결과 박스의 y 좌표로 어느 번호판에서 나온 결과인지 되돌림
+        results = [[] for _ in batch]
+        for res in recognized:
+            box_y_min = min(point[1] for point in res[0])
+            results[min(int(box_y_min) // crop_h, len(batch) - 1)].append(res)
+        return results
+
+    def filter_ocr_result(self, ocr_result):
+        """OCR 결과 중 min_confidence 이상이고 숫자 2~4자리인 것만 (번호, 신뢰도)로 반환."""
+        filtered = []
+        for res in ocr_result:
+            text, confidence = res[1], res[2]
+            # print(f"OCR detected text: {text}, Confidence: {confidence}")
+            if confidence >= self.min_confidence:
+                text = ''.join(filter(str.isdigit, text))
+                if 2 <= len(text) <= 4:
+                    filtered.append((text, confidence))
+        return filtered
+
+    def recognize_window(self, frames, detections=None):
+        """
+        한 창(window)의 프레임들에서 번호판을 찾아 OCR합니다.
+
+        Returns:
+            tuple: ((번호, 신뢰도) 리스트, 추적기를 쓰면 이번 창에서 보인 track 리스트 / 아니면 None)
+        """
+        readings = []
+
+        if detections is None:
+            detections = self.detect(frames)
+
+        # 창(window) 안의 모든 프레임에서 번호판을 먼저 모은 뒤 OCR은 한 번에 batch로 실행
+        with self._timed("crop"):
+            crops = self.extract_plate_crops(frames, detections)
+            candidates = [(crop, self.crop_quality(crop[3])) for crop in crops]
+
+            # (크롭, 품질, track) 후보 목록: 추적기가 있으면 track마다 새롭거나 나아진 크롭만 남김
+            active_tracks = None
+            if self.tracker is not None:
+                candidates, active_tracks = self._select_tracked_crops(len(frames), candidates)
+            else:
+                candidates = [(crop, quality, None) for crop, quality in candidates if quality is not None]
+
+            if self.quality_gate is not None:
+                candidates = self.quality_gate.best(candidates)
+                print(f"Crop quality gate : {self.quality_gate.stats()}")
+
+        with self._timed("preprocess"):
+            preprocessed_imgs = [ImageProcessor.preprocess_image(crop[3]) for crop, _, _ in candidates]
+
+        with self._timed("ocr"):
+            ocr_results = self.recognize_crops(preprocessed_imgs)
+        if self.timer is not None:
+            self.timer.count("frames", len(frames))
+            self.timer.count("plate_crops", len(crops))
+            self.timer.count("ocr_crops", len(preprocessed_imgs))
+
+        for (crop, quality, track), ocr_result in zip(candidates, ocr_results):
+            crop_readings = self.filter_ocr_result(ocr_result) if ocr_result else []
+            if not ocr_result:
+                print(f"No OCR results for frame {crop[0]}, box {crop[1]}")
+            if track is not None:
+                self.tracker.record(track, quality, [text for text, _ in crop_readings])
+            readings.extend(crop_readings)
+
+        return readings, active_tracks
+
+    def process_frame(self, frames, detections=None):
+        """
+        프레임들에서 번호판을 찾아 OCR하고 가장 많이 인식된 번호를 반환합니다.
+
+        Parameters:
+            frames (list): 처리할 프레임 리스트.
+            detections (list): detect(frames) 결과. 이미 검출했다면 넘겨서 재사용 (없으면 여기서 batch 검출).
+        """
+        readings, active_tracks = self.recognize_window(frames, detections)
+
+        # 추적기를 쓰면 이번 창에 보인 번호판들의 누적 투표로, 아니면 이번 창의 OCR 결과로 다수결
+        if active_tracks is None:
+            votes = Counter(text for text, _ in readings)
+        else:
+            votes = self.tracker.vote(active_tracks)
+
+        if votes:
+            most_common_text = votes.most_common(1)[0][0]
             if most_common_text not in self.processed_numbers:
                 print(f"Detected text: {most_common_text}")
                 return most_common_text
 
         return None
-    
+
+    def process_stream(self, frames, min_margin=1, min_votes=2, strong_confidence=0.9):
+        """
+        프레임을 한 장씩 처리하면서, 한 번호가 충분히 앞서면 남은 프레임을 기다리지 않고 바로 반환합니다.
+        결론 조건은 PlateVote 참고.
+
+        Parameters:
+            frames (iterable): 프레임을 한 장씩 주는 iterable (EX: YOLOVideoCapture.iter_frames(3.0)).
+
+        Returns:
+            str: 인식된 번호. 프레임이 끝날 때까지 조건을 만족하지 못하면 그때까지의 다수결 (없으면 None).
+        """
+        vote = PlateVote(min_margin, min_votes, strong_confidence)
+        frame_count = 0
+
+        for frame_count, frame in enumerate(frames, 1):
+            readings, _ = self.recognize_window([frame])
+            vote.add(readings)
+            decided = vote.decided()
+            if decided is not None:
+                print(f"Decided after {frame_count} frames")
+                return decided if decided not in self.processed_numbers else None
+
+        print(f"No confident decision after {frame_count} frames, votes : {dict(vote.votes)}")
+        most_common_text = vote.leader()
+        if most_common_text is not None and most_common_text not in self.processed_numbers:
+            print(f"Detected text: {most_common_text}")
+            return most_common_text
+        return None
+
+
+# 캡처 -> YOLO 검출 -> OCR -> 버스 정보 조회를 각각 스레드로 돌리는 파이프라인
+# 단계 사이는 크기가 제한된 Queue로 이어서 앞 단계가 너무 앞서가지 않게 하고(backpressure),
+# GPS 위치 / 가까운 정류소 / 정류소 도착 정보 조회는 영상 처리와 동시에 시작함
+class BusInfoPipeline:
+    _END = object()  # 단계 종료 표시
+
+    def __init__(self, video_capture, frame_processor, bus_api, locate, capture_deadline=3.0,
+                 queue_size=2, batch_size=4, min_margin=1, min_votes=2, strong_confidence=0.9,
+                 context_timeout=10.0):
+        """
+        Parameters:
+            video_capture (YOLOVideoCapture): 프레임을 읽어올 캡처 객체.
+            frame_processor (FrameProcessor): 검출/OCR에 사용할 객체.
+            bus_api (API): DB/버스 정보 API 객체.
+            locate (callable): 현재 위치 (latitude, longitude)를 반환하는 함수. 위치가 없으면 (None, None). EX) gps_sub
+            capture_deadline (float): 최대 캡처 시간(초).
+            queue_size (int): 단계 사이 Queue의 최대 크기.
+            batch_size (int): 검출 단계가 한 번에 모아서 처리할 최대 프레임 수.
+            context_timeout (float): 번호가 정해진 뒤 정류소 조회(위치 포함)를 기다릴 최대 시간(초).
+        """
+        self.video_capture = video_capture
+        self.frame_processor = frame_processor
+        self.bus_api = bus_api
+        self.locate = locate
+        self.capture_deadline = capture_deadline
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.vote_options = (min_margin, min_votes, strong_confidence)
+        self.context_timeout = context_timeout
+
+    def run(self):
+        """
+        파이프라인을 실행하고 결과를 반환합니다.
+
+        Returns:
+            dict: bus_num, routeid, station_name, station_id, arrival(ArrivalTable 레코드), timings.
+                  단계가 실패하거나 찾지 못한 값은 None.
+        """
+        self.stop_event = threading.Event()
+        self.frame_queue = Queue(maxsize=self.queue_size)
+        self.detection_queue = Queue(maxsize=self.queue_size)
+        self.number_queue = Queue(maxsize=1)
+        self.context_ready = threading.Event()
+        self.context = {"station_name": None, "station_id": None}
+        self.timings = {}
+        self.start_time = time.time()
+
+        stages = [
+            threading.Thread(target=self._stage, args=("capture", self._capture), daemon=True),
+            threading.Thread(target=self._stage, args=("detect", self._detect), daemon=True),
+            threading.Thread(target=self._stage, args=("ocr", self._ocr), daemon=True),
+            threading.Thread(target=self._stage, args=("context", self._prepare_context), daemon=True),
+        ]
+        for stage in stages:
+            stage.start()
+
+        try:
+            result = self._lookup()
+        finally:
+            # 조회가 실패해도 캡처/검출/OCR을 멈추고, 모든 단계가 끝난 뒤 반환
+            # (다음 요청의 frame_processor.reset()이나 video_capture.release()와 겹치지 않도록)
+            self.stop_event.set()
+            for stage in stages:
+                stage.join()
+
+        result["timings"] = self.timings
+        print(f"Pipeline timings : {self.timings}")
+        return result
+
+    def _stage(self, name, target):
+        try:
+            target()
+        except Exception as e:
+            print(f"Pipeline stage '{name}' failed: {str(e)}")
+            self.stop_event.set()
+        finally:
+            self.timings[name] = time.time() - self.start_time
+            # 다음 단계가 끝나기를 기다리지 않도록 종료 표시를 전달
+            if name == "capture":
+                self._put(self.frame_queue, self._END, give_up_after=1.0)
+            elif name == "detect":
+                self._put(self.detection_queue, self._END, give_up_after=1.0)
+            elif name == "ocr" and self.number_queue.empty():
+                self.number_queue.put(None)
+            elif name == "context":
+                self.context_ready.set()
+
+    def _put(self, queue, item, give_up_after=None):
+        """
+        Queue가 가득 차 있으면 다음 단계가 따라올 때까지 기다렸다가 넣습니다 (backpressure).
+        중단(stop_event)된 뒤에는 give_up_after초까지만 기다리고, 넣지 못하면 False.
+        """
+        stopped_at = None
+        while True:
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                if not self.stop_event.is_set():
+                    continue
+                stopped_at = stopped_at or time.time()
+                if give_up_after is None or time.time() - stopped_at >= give_up_after:
+                    return False
+
+    def _get(self, queue):
+        """Queue에서 꺼냅니다. 중단(stop_event)된 뒤 Queue가 비어 있으면 종료 표시(_END)를 반환."""
+        while True:
+            try:
+                return queue.get(timeout=0.1)
+            except Empty:
+                if self.stop_event.is_set():
+                    return self._END
+
+    def _capture(self):
+        for frame in self.video_capture.iter_frames(self.capture_deadline):
+            if self.stop_event.is_set() or not self._put(self.frame_queue, frame):
+                break
+
+    def _detect(self):
+        while True:
+            frames = [self._get(self.frame_queue)]
+            # 밀려 있는 프레임이 있으면 batch_size까지 함께 검출
+            while len(frames) < self.batch_size and not self.frame_queue.empty():
+                frames.append(self.frame_queue.get_nowait())
+            ended = frames[-1] is self._END
+            frames = [frame for frame in frames if frame is not self._END]
+
+            if frames and not self.stop_event.is_set():
+                self._put(self.detection_queue, (frames, self.frame_processor.detect(frames)))
+            if ended:
+                return
+
+    def _ocr(self):
+        vote = PlateVote(*self.vote_options)
+        processor = self.frame_processor
+        decided = None
+        while True:
+            item = self._get(self.detection_queue)
+            if item is self._END:
+                break
+            if self.stop_event.is_set():
+                continue  # 이미 결론이 났으면 남은 검출 결과는 버리고 Queue만 비움
+            frames, detections = item
+            readings, _ = processor.recognize_window(frames, detections)
+            vote.add(self._valid_readings(readings))
+            decided = vote.decided()
+            if decided is not None:
+                self.stop_event.set()  # 캡처 중단
+                self.number_queue.put(decided if decided not in processor.processed_numbers else None)
+
+        if decided is None:
+            # 캡처 시간이 끝날 때까지 결론이 안 나면 그때까지의 다수결
+            leader = vote.leader()
+            print(f"No confident decision, votes : {dict(vote.votes)}")
+            self.number_queue.put(leader if leader not in processor.processed_numbers else None)
+
+    def _valid_readings(self, readings):
+        """
+        이번 창의 OCR 결과 중 실제 버스 번호(routeid 사전에 있는 번호)만 남깁니다.
+        잘못 읽은 번호(EX: 143 -> 14)가 투표에서 이기지 않도록 모든 후보를 한 번에 검증.
+        """
+        if not readings:
+            return readings
+        try:
+            valid = self.bus_api.bus_routes.resolve_many(text for text, _ in readings)
+        except Exception as e:
+            print(f"Bus route validation failed, voting on raw OCR results: {str(e)}")
+            return readings
+        rejected = [text for text, _ in readings if text not in valid]
+        if rejected:
+            print(f"Rejected OCR results not in bus table : {rejected}")
+        return [(text, confidence) for text, confidence in readings if text in valid]
+
+    def _prepare_context(self):
+        # 버스 번호와 무관한 조회는 영상 처리와 동시에 진행
+        self.bus_api.bus_routes.ensure_loaded()  # routeid 사전 미리 로드
+        stations = self.bus_api.load_station_snapshot()
+
+        latitude, longitude = self.locate()
+        if latitude is None or longitude is None:
+            print("GPS 위치를 받지 못해 정류소를 찾을 수 없습니다.")
+            return
+        index = self.bus_api.find_nearest_index(longitude, latitude)
+        self.context["station_name"] = stations.station_name[index]
+        self.context["station_id"] = stations.node_id[index]
+        print(f"찾아낸 정류소의 이름 :{self.context['station_name']}, 찾아낸 정류소의 id :{self.context['station_id']}")
+        self.context_ready.set()
+
+        # 정류소 도착 정보를 미리 받아 캐시에 넣어둠 (번호가 정해지면 캐시에서 바로 사용)
+        self.bus_api.station_bus_list(self.context["station_id"])
+
+    def _lookup(self):
+        result = {"bus_num": None, "routeid": None, "station_name": None, "station_id": None, "arrival": None}
+
+        bus_num = self.number_queue.get()
+        self.timings["number"] = time.time() - self.start_time
+        result["bus_num"] = bus_num
+        if bus_num is None:
+            return result
+
+        result["routeid"] = self.bus_api.resolve_bus_route(bus_num)
+
+        if not self.context_ready.wait(self.context_timeout):
+            print("정류소 조회가 제한 시간 안에 끝나지 않았습니다.")
+        result["station_name"] = self.context["station_name"]
+        result["station_id"] = self.context["station_id"]
+        if result["routeid"] is None or result["station_id"] is None:
+            return result
+
+        response = self.bus_api.station_bus_list(result["station_id"])
+        result["arrival"] = self.bus_api.parse_arrival_info(response).find(bus_num)
+        self.timings["lookup"] = time.time() - self.start_time
+        return result
+
+
 #=========================== STT =============================
+# 음성 인식 설정
+STT_LANGUAGE_CODE = "ko-KR"
+STT_SAMPLE_RATE = 16000  # 음성 인식에는 16kHz면 충분 (44.1kHz보다 전송량이 약 1/3)
+STT_CHUNK_MS = 100
+MIC_SAMPLE_RATE = 44100  # 장치의 기본 샘플링 레이트를 알 수 없을 때 마이크를 여는 레이트 (기존 녹음 설정)
+STT_PHRASES = ["버스", "몇분 남았어", "언제 와", "언제 도착해", "얼마나", "남았어"]
+
+
+_stt_client = None
+_stt_lock = threading.Lock()
+
+
+def get_stt_client():
+    """STT 클라이언트는 한 번만 만들어서 재사용."""
+    global _stt_client
+    with _stt_lock:
+        if _stt_client is None:
+            _stt_client = speech.SpeechClient()
+        return _stt_client
+
+
+def record_audio(seconds, filename=None, rate=44100):
+    """
+    음성을 녹음해서 16bit mono 샘플(bytes)을 반환합니다.
+
+    Parameters:
+        seconds (float): 녹음 시간.
+        filename (str): 주어지면 기록용으로 WAV 파일도 저장.
+        rate (int): 녹음 샘플링 레이트.
 
-def record_audio(seconds, filename="request.wav"):
+    Returns:
+        tuple: (샘플 bytes, 샘플링 레이트)
+    """
     #음성 녹음
     chunk = 1024
     format = pyaudio.paInt16
     channels = 1
-    rate = 44100
 
     p = pyaudio.PyAudio()
 
@@ -392,24 +2344,176 @@ def record_audio(seconds, filename="request.wav"):
     stream.close()
     p.terminate()
 
-    wf = wave.open(filename, 'wb')
-    wf.setnchannels(channels)
-    wf.setsampwidth(p.get_sample_size(format))
-    wf.setframerate(rate)
-    wf.writeframes(b''.join(frames))
-    wf.close()
+    audio = b''.join(frames)
+    if filename:
+        wf = wave.open(filename, 'wb')
+        wf.setnchannels(channels)
+        wf.setsampwidth(p.get_sample_size(format))
+        wf.setframerate(rate)
+        wf.writeframes(audio)
+        wf.close()
+    return audio, rate
+
+
+def trim_silence(samples, rate, frame_ms=20, threshold_ratio=0.1, min_rms=200, padding_ms=150):
+    """
+    앞뒤의 조용한 구간을 잘라냅니다. 프레임별 RMS가 max(min_rms, 가장 큰 RMS * threshold_ratio) 이상인
+    첫 프레임과 마지막 프레임 사이(앞뒤로 padding_ms 여유)만 남김.
+
+    Parameters:
+        samples (np.ndarray): int16 샘플.
+        rate (int): 샘플링 레이트.
+
+    Returns:
+        np.ndarray: 잘라낸 샘플. 말소리가 없으면 그대로 반환.
+    """
+    frame = max(1, int(rate * frame_ms / 1000))
+    n_frames = len(samples) // frame
+    if n_frames == 0:
+        return samples
+
+    frames = samples[:n_frames * frame].astype(np.float32).reshape(n_frames, frame)
+    levels = np.sqrt(np.mean(frames * frames, axis=1))
+    voiced = np.flatnonzero(levels >= max(min_rms, levels.max() * threshold_ratio))
+    if voiced.size == 0:
+        return samples
+
+    padding = int(rate * padding_ms / 1000)
+    begin = max(0, voiced[0] * frame - padding)
+    end = min(len(samples), (voiced[-1] + 1) * frame + padding)
+    return samples[begin:end]
+
+
+_resample_filters = {}
+
+
+def _lowpass_filter(cutoff, taps):
+    # 윈도우 sinc 저역통과 필터 (cutoff: 나이퀴스트 대비 0~1), 같은 설정은 한 번만 만듦
+    key = (round(cutoff, 6), taps)
+    fir = _resample_filters.get(key)
+    if fir is None:
+        n = np.arange(taps) - (taps - 1) / 2
+        fir = cutoff * np.sinc(cutoff * n) * np.blackman(taps)
+        fir = (fir / fir.sum()).astype(np.float32)
+        _resample_filters[key] = fir
+    return fir
+
+
+def resample_audio(samples, src_rate, dst_rate=STT_SAMPLE_RATE, taps=101):
+    """
+    샘플링 레이트를 바꿉니다. 줄이는 경우 먼저 윈도우 sinc FIR로 새 나이퀴스트 주파수 위를 걸러서
+    에일리어싱을 막고, 새 샘플 위치에서 선형 보간.
+
+    Parameters:
+        samples (np.ndarray): int16 샘플.
+        src_rate (int): 원래 샘플링 레이트. EX) 44100
+        dst_rate (int): 바꿀 샘플링 레이트. EX) 16000
+
+    Returns:
+        np.ndarray: int16 샘플.
+    """
+    if src_rate == dst_rate or len(samples) == 0:
+        return samples
+
+    x = samples.astype(np.float32)
+    if dst_rate < src_rate:
+        x = np.convolve(x, _lowpass_filter(0.9 * dst_rate / src_rate, taps), mode="same")
+
+    n_out = int(len(samples) * dst_rate / src_rate)
+    positions = np.arange(n_out) * (src_rate / dst_rate)
+    y = np.interp(positions, np.arange(len(x)), x)
+    return np.clip(np.round(y), -32768, 32767).astype(np.int16)
+
+
+# 청크 단위로 들어오는 음성을 리샘플링 (스트리밍 인식용)
+# 이전 청크의 끝부분을 이어서 필터링/보간하므로 청크 경계에서 소리가 끊기거나 샘플 간격이 틀어지지 않음
+class StreamResampler:
+    def __init__(self, src_rate, dst_rate=STT_SAMPLE_RATE, taps=101):
+        """
+        Parameters:
+            src_rate (int): 입력 샘플링 레이트. EX) 44100
+            dst_rate (int): 출력 샘플링 레이트. EX) 16000
+            taps (int): 저역통과 필터 길이.
+        """
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self.step = src_rate / dst_rate
+        self.fir = _lowpass_filter(0.9 * dst_rate / src_rate, taps) if dst_rate < src_rate else None
+        self._history = np.zeros(taps - 1 if self.fir is not None else 0, dtype=np.float32)  # 필터에 이어 넣을 이전 입력
+        self._last = 0.0       # 이전 청크의 마지막 (필터링된) 샘플, 청크 경계 보간용
+        self._position = 0.0   # 다음 출력 샘플 위치 (이번 청크 시작 기준, 입력 샘플 단위, -1 이상)
+
+    def process(self, samples):
+        """
+        int16 샘플 청크 하나를 리샘플링합니다.
 
-def recognize_speech_from_audio(filename):
-    stt_client = speech.SpeechClient()
+        Returns:
+            np.ndarray: int16 샘플. 청크마다 길이가 1개 정도 달라질 수 있음.
+        """
+        if self.src_rate == self.dst_rate or len(samples) == 0:
+            return samples
+
+        x = samples.astype(np.float32)
+        if self.fir is not None:
+            # 이전 입력을 앞에 붙이고 valid 구간만 계산 (출력은 필터 길이의 절반만큼 늦어짐)
+            extended = np.concatenate((self._history, x))
+            self._history = extended[len(extended) - len(self._history):]
+            x = np.convolve(extended, self.fir, mode="valid")
+
+        # 이전 청크의 마지막 샘플을 위치 -1에 두고 보간
+        n = len(x)
+        n_out = int(np.floor((n - 1 - self._position) / self.step)) + 1 if self._position <= n - 1 else 0
+        positions = self._position + np.arange(n_out) * self.step
+        y = np.interp(positions, np.arange(-1, n), np.concatenate(([self._last], x)))
+        self._position += n_out * self.step - n
+        self._last = x[-1]
+        return np.clip(np.round(y), -32768, 32767).astype(np.int16)
+
+
+def prepare_speech_audio(audio, rate, dst_rate=STT_SAMPLE_RATE):
+    """
+    음성 인식에 보내기 전 전처리: 앞뒤 무음 제거 -> 16kHz로 리샘플링. 모두 메모리에서 처리.
+
+    Parameters:
+        audio (bytes): 16bit mono 샘플.
+        rate (int): 샘플링 레이트.
+
+    Returns:
+        bytes: dst_rate의 16bit mono 샘플.
+    """
+    samples = np.frombuffer(audio, dtype=np.int16)
+    samples = trim_silence(samples, rate)
+    return resample_audio(samples, rate, dst_rate).tobytes()
+
+
+def recognize_speech_from_audio(audio, sample_rate=None):
+    """
+    녹음된 음성을 인식합니다.
+
+    Parameters:
+        audio (str 또는 bytes): WAV 파일 경로, 또는 16bit mono 샘플(bytes) (이 경우 sample_rate 필요).
+        sample_rate (int): audio가 bytes일 때의 샘플링 레이트.
+
+    Returns:
+        str: 인식된 텍스트 (없으면 빈 문자열).
+    """
+    if isinstance(audio, str):
+        with wave.open(audio, 'rb') as wf:
+            sample_rate = wf.getframerate()
+            audio = wf.readframes(wf.getnframes())
+
+    # 무음 제거 + 16kHz 리샘플링으로 업로드 크기를 줄임
+    audio_content = prepare_speech_audio(audio, sample_rate)
+
+    stt_client = get_stt_client()
 
-    with open(filename, 'rb') as audio_file:
-        audio_content = audio_file.read()
-    
     audio = speech.RecognitionAudio(content=audio_content)
     
     config = speech.RecognitionConfig(
-        language_code="ko-KR",
-        speech_contexts=[speech.SpeechContext(phrases=["버스", "몇분 남았어", "언제 와", "언제 도착해", "얼마나", "남았어"])],
+        encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+        sample_rate_hertz=STT_SAMPLE_RATE,
+        language_code=STT_LANGUAGE_CODE,
+        speech_contexts=[speech.SpeechContext(phrases=STT_PHRASES)],
     )
     
     response = stt_client.recognize(config=config, audio=audio)
@@ -419,6 +2523,199 @@ def recognize_speech_from_audio(filename):
     return ""
 
 
+# 마이크 입력의 에너지(RMS)로 말의 시작과 끝을 판단하는 간단한 VAD
+# 처음 몇 개 청크로 주변 소음 크기를 재고, 가장 조용했던 청크보다 speech_ratio배 이상 크면 말하는 중으로 봄
+class EnergyVAD:
+    def __init__(self, chunk_ms=STT_CHUNK_MS, calibration_ms=300, speech_ratio=3.0, min_rms=300, max_noise_rms=800,
+                 end_silence_ms=700, no_speech_timeout_ms=5000, max_duration_ms=8000):
+        """
+        Parameters:
+            chunk_ms (int): 청크 하나의 길이.
+            calibration_ms (int): 시작 후 주변 소음 크기를 재는 시간.
+            speech_ratio (float): 소음 대비 몇 배 이상이면 말소리로 볼지.
+            min_rms (float): 말소리로 보는 최소 RMS (조용한 환경에서 작은 잡음에 반응하지 않도록).
+            max_noise_rms (float): 소음 추정값의 상한 (녹음 시작부터 말하고 있어도 말소리를 소음으로 착각하지 않도록).
+            end_silence_ms (int): 말한 뒤 이만큼 조용하면 발화 종료.
+            no_speech_timeout_ms (int): 이 시간 안에 말이 시작되지 않으면 종료.
+            max_duration_ms (int): 최대 녹음 시간.
+        """
+        self.chunk_ms = chunk_ms
+        self.calibration_chunks = max(1, calibration_ms // chunk_ms)
+        self.speech_ratio = speech_ratio
+        self.min_rms = min_rms
+        self.max_noise_rms = max_noise_rms
+        self.end_silence_chunks = max(1, end_silence_ms // chunk_ms)
+        self.no_speech_chunks = no_speech_timeout_ms // chunk_ms
+        self.max_chunks = max_duration_ms // chunk_ms
+        self.reset()
+
+    def reset(self):
+        self.noise_rms = None
+        self.chunks = 0
+        self.speech_started = False
+        self.silent_chunks = 0
+
+    @staticmethod
+    def rms(chunk):
+        samples = np.frombuffer(chunk, dtype=np.int16).astype(np.float32)
+        return float(np.sqrt(np.mean(samples * samples))) if samples.size else 0.0
+
+    def update(self, chunk):
+        """
+        청크 하나를 넣고 발화가 끝났는지 반환합니다.
+
+        Returns:
+            bool: True면 녹음을 멈춰도 됨.
+        """
+        level = self.rms(chunk)
+        self.chunks += 1
+
+        if not self.speech_started and self.chunks <= self.calibration_chunks:
+            # 소음 크기 추정: 바로 말을 시작해도 값이 커지지 않도록 가장 조용한 청크 기준
+            level_for_noise = min(level, self.max_noise_rms)
+            self.noise_rms = level_for_noise if self.noise_rms is None else min(self.noise_rms, level_for_noise)
+
+        threshold = max(self.min_rms, (self.noise_rms or 0.0) * self.speech_ratio)
+        if level >= threshold:
+            self.speech_started = True
+            self.silent_chunks = 0
+        elif self.speech_started:
+            self.silent_chunks += 1
+
+        if self.speech_started and self.silent_chunks >= self.end_silence_chunks:
+            return True
+        if not self.speech_started and self.chunks >= self.no_speech_chunks:
+            return True
+        return self.chunks >= self.max_chunks
+
+
+# 마이크에서 청크를 읽어서 16kHz로 바꿔 바로 내보내는 스트림
+# 마이크는 장치의 기본 샘플링 레이트로 열고 (16kHz를 지원하지 않는 장치가 있음) 청크마다 리샘플링
+# VAD가 발화 종료를 판단하거나 stop()이 호출되면 끝남
+class MicrophoneStream:
+    def __init__(self, rate=STT_SAMPLE_RATE, chunk_ms=STT_CHUNK_MS, vad=None, capture_rate=None):
+        """
+        Parameters:
+            rate (int): 내보내는 청크의 샘플링 레이트.
+            chunk_ms (int): 청크 하나의 길이.
+            vad (EnergyVAD): 발화 종료 판단기. 없으면 기본 설정으로 생성.
+            capture_rate (int): 마이크를 여는 샘플링 레이트. 없으면 입력 장치의 기본 레이트 (모르면 MIC_SAMPLE_RATE).
+        """
+        self.rate = rate
+        self.chunk_ms = chunk_ms
+        self.capture_rate = capture_rate
+        self.vad = vad if vad is not None else EnergyVAD(chunk_ms=chunk_ms)
+        self.frames = []
+        self._stop = threading.Event()
+
+    @staticmethod
+    def default_capture_rate(p):
+        try:
+            return int(p.get_default_input_device_info()["defaultSampleRate"])
+        except Exception as e:
+            print(f"Failed to read the input device sample rate, using {MIC_SAMPLE_RATE}: {str(e)}")
+            return MIC_SAMPLE_RATE
+
+    def stop(self):
+        self._stop.set()
+
+    def chunks(self):
+        p = pyaudio.PyAudio()
+        capture_rate = self.capture_rate or self.default_capture_rate(p)
+        chunk = int(capture_rate * self.chunk_ms / 1000)
+        resampler = StreamResampler(capture_rate, self.rate)
+        try:
+            stream = p.open(format=pyaudio.paInt16,
+                            channels=1,
+                            rate=capture_rate,
+                            input=True,
+                            frames_per_buffer=chunk)
+        except Exception:
+            p.terminate()
+            raise
+        print("Recording...")
+        self.vad.reset()
+        try:
+            while not self._stop.is_set():
+                data = stream.read(chunk, exception_on_overflow=False)
+                data = resampler.process(np.frombuffer(data, dtype=np.int16)).tobytes()
+                self.frames.append(data)
+                yield data
+                if self.vad.update(data):
+                    break
+        finally:
+            print("Finished recording.")
+            stream.stop_stream()
+            stream.close()
+            p.terminate()
+
+
+def streaming_recognize_speech(stop_on_number=True, vad=None, on_partial=None):
+    """
+    녹음하면서 오디오 청크를 바로 스트리밍 인식으로 보내고, 중간 결과(interim)도 받아서 버스 번호를 찾습니다.
+    VAD로 말이 끝나면 녹음을 멈추고, stop_on_number=True면 번호와 의도가 모두 확인되는 즉시 멈춤.
+    번호만 확인되고 의도("언제 와" 등)가 아직 없으면 VAD가 발화 종료를 판단할 때까지 계속 들음
+    (번호에서 바로 멈추면 "143번 언제 와"가 "143번"으로 잘려 determine_intent가 항상 "unknown"이 됨).
+
+    Parameters:
+        stop_on_number (bool): 번호(중간 결과에서 두 번 연속 같거나 확정 결과에 있는 번호)와 의도가 모두 확인되면 바로 종료.
+        vad (EnergyVAD): 발화 종료 판단기. 없으면 기본 설정으로 생성.
+        on_partial (callable): 중간 결과가 나올 때마다 on_partial(transcript)로 호출.
+
+    Returns:
+        tuple: (인식된 텍스트, 버스 번호 또는 None)
+    """
+    stt_client = get_stt_client()
+    mic = MicrophoneStream(vad=vad)
+
+    config = speech.RecognitionConfig(
+        encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+        sample_rate_hertz=mic.rate,
+        language_code=STT_LANGUAGE_CODE,
+        speech_contexts=[speech.SpeechContext(phrases=STT_PHRASES)],
+    )
+    streaming_config = speech.StreamingRecognitionConfig(config=config, interim_results=True)
+
+    requests_iter = (speech.StreamingRecognizeRequest(audio_content=chunk) for chunk in mic.chunks())
+    responses = stt_client.streaming_recognize(config=streaming_config, requests=requests_iter)
+
+    final_text = ""
+    transcript = ""
+    bus_number = None
+    last_partial_number = None
+    try:
+        for response in responses:
+            for result in response.results:
+                if not result.alternatives:
+                    continue
+                text = result.alternatives[0].transcript
+                transcript = (final_text + " " + text).strip()
+                if result.is_final:
+                    final_text = transcript
+                if on_partial is not None:
+                    on_partial(transcript)
+
+                number = extract_bus_number(transcript)
+                if number is None:
+                    last_partial_number = None
+                    continue
+                # 중간 결과는 뒤 숫자가 덧붙을 수 있으므로(14 -> 143) 두 번 연속 같거나 확정 결과일 때만 채택
+                if result.is_final or number == last_partial_number:
+                    bus_number = number
+                last_partial_number = number
+
+            if stop_on_number and bus_number is not None and determine_intent(transcript) != "unknown":
+                mic.stop()
+                break
+    except Exception as e:
+        print(f"Streaming recognition failed: {str(e)}")
+        mic.stop()
+
+    if bus_number is None:
+        bus_number = extract_bus_number(transcript)
+    return transcript, bus_number
+
+
 def extract_bus_number(text):
     matches = re.findall(r'\d{3,}', text)
     return matches[0] if matches else None
@@ -434,65 +2731,570 @@ def determine_intent(text):
 
 
 #=========================== TTS =============================
-def text_to_speech_ssml(ssml_text, output_file):
-    client = texttospeech.TextToSpeechClient()
+# 음성 설정
+TTS_LANGUAGE_CODE = "ko-KR"
+TTS_GENDER = "NEUTRAL"
+TTS_SAMPLE_RATE = 24000  # LINEAR16(PCM)로 합성할 때의 샘플링 레이트
+
+# 합성한 음성을 저장해두는 경로
+TTS_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tts_cache")
+
+# 항상 같은 내용으로 쓰이는 문장/문구 (시작할 때 미리 합성해서 캐시에 넣어둠)
+TTS_STATIC_PHRASES = [
+    "아무 번호도 인식되지 않았습니다.",
+    "버스 번호를 인식할 수 없습니다. 다시 시도해주세요.",
+    "번 버스가 도착했습니다.",
+    "번 버스가 도착하지 않았습니다.",
+    "첫번째 버스 도착 예정시간 :",
+    "두번째 버스 도착 예정시간 :",
+]
+
+
+# 합성한 음성을 (텍스트, 음성, 인코딩)의 해시로 저장하는 메모리 + 디스크 캐시
+# 같은 문장은 다시 합성하지 않고 네트워크 요청 없이 바로 재생할 수 있음
+class TTSCache:
+    def __init__(self, cache_dir=TTS_CACHE_DIR, max_bytes=50 * 1024 * 1024, memory_items=64):
+        """
+        Parameters:
+            cache_dir (str): 음성 파일을 저장할 디렉터리.
+            max_bytes (int): 디스크 캐시 최대 크기. 넘으면 가장 오래 쓰지 않은 파일부터 삭제.
+            memory_items (int): 메모리에 보관할 최대 음성 수.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._disk_bytes = sum(os.path.getsize(path) for path in self._disk_files())
+
+    @staticmethod
+    def key(text, voice, encoding):
+        return hashlib.sha256(f"{voice}\x00{encoding}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.audio")
+
+    def _disk_files(self):
+        return [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith(".audio")]
+
+    def _remember(self, key, audio):
+        self._memory[key] = audio
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """캐시된 음성(bytes)을 반환. 없으면 None."""
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return audio
+
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    audio = f.read()
+                os.utime(path)  # 디스크 LRU 순서를 위해 사용 시각 갱신
+            except FileNotFoundError:
+                self.misses += 1
+                return None
+            self._remember(key, audio)
+            self.hits += 1
+            return audio
+
+    def put(self, key, audio):
+        with self._lock:
+            self._remember(key, audio)
+            path = self._path(key)
+            if os.path.exists(path):
+                return
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(audio)
+            os.replace(tmp, path)
+            self._disk_bytes += len(audio)
+            if self._disk_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        files = sorted(self._disk_files(), key=os.path.getmtime)
+        for path in files:
+            if self._disk_bytes <= self.max_bytes:
+                break
+            size = os.path.getsize(path)
+            os.remove(path)
+            self._disk_bytes -= size
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "memory_items": len(self._memory), "disk_bytes": self._disk_bytes}
+
+
+_tts_client = None
+_tts_cache = None
+_tts_lock = threading.Lock()
+
+
+def get_tts_client():
+    """TTS 클라이언트는 한 번만 만들어서 재사용."""
+    global _tts_client
+    with _tts_lock:
+        if _tts_client is None:
+            _tts_client = texttospeech.TextToSpeechClient()
+        return _tts_client
+
+
+def get_tts_cache():
+    global _tts_cache
+    with _tts_lock:
+        if _tts_cache is None:
+            _tts_cache = TTSCache()
+        return _tts_cache
+
+
+def synthesize_speech(ssml_text, audio_encoding="MP3", use_cache=True):
+    """
+    문장을 합성해서 음성(bytes)을 반환합니다. 캐시에 있으면 네트워크 요청 없이 반환.
+
+    Parameters:
+        ssml_text (str): 합성할 문장 (SSML).
+        audio_encoding (str): texttospeech.AudioEncoding 이름. EX) "MP3", "LINEAR16"
+        use_cache (bool): 캐시 사용 여부.
+    """
+    # LINEAR16은 샘플링 레이트에 따라 결과가 달라지므로 캐시 키에 함께 넣음
+    encoding_key = f"{audio_encoding}/{TTS_SAMPLE_RATE}" if audio_encoding == "LINEAR16" else audio_encoding
+    cache = get_tts_cache() if use_cache else None
+    key = TTSCache.key(ssml_text, f"{TTS_LANGUAGE_CODE}/{TTS_GENDER}", encoding_key)
+    if cache is not None:
+        audio = cache.get(key)
+        if audio is not None:
+            return audio
+
+    client = get_tts_client()
 
     # SSML 입력 설정
     synthesis_input = texttospeech.SynthesisInput(ssml=ssml_text)
 
     # 음성 설정
     voice = texttospeech.VoiceSelectionParams(
-        language_code="ko-KR",
-        ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL,
+        language_code=TTS_LANGUAGE_CODE,
+        ssml_gender=texttospeech.SsmlVoiceGender[TTS_GENDER],
     )
 
     # 오디오 설정
-    audio_config = texttospeech.AudioConfig(
-        audio_encoding=texttospeech.AudioEncoding.MP3
-    )
+    if audio_encoding == "LINEAR16":
+        audio_config = texttospeech.AudioConfig(
+            audio_encoding=texttospeech.AudioEncoding.LINEAR16,
+            sample_rate_hertz=TTS_SAMPLE_RATE,
+        )
+    else:
+        audio_config = texttospeech.AudioConfig(
+            audio_encoding=texttospeech.AudioEncoding[audio_encoding]
+        )
 
     # 음성 합성 요청
     response = client.synthesize_speech(
         input=synthesis_input, voice=voice, audio_config=audio_config
     )
 
+    if cache is not None:
+        cache.put(key, response.audio_content)
+    return response.audio_content
+
+
+# 메모리에 있는 PCM 음성 (16bit 샘플 bytes, 샘플링 레이트, 채널 수, 샘플 크기[byte])
+PCMAudio = namedtuple("PCMAudio", ["samples", "sample_rate", "channels", "sample_width"])
+
+
+def decode_linear16(audio):
+    """
+    LINEAR16 합성 결과를 PCMAudio로 변환합니다.
+    Google TTS의 LINEAR16 응답은 앞에 WAV 헤더가 붙어 있으므로 wave 모듈로 헤더를 읽고 샘플만 꺼냄.
+    헤더가 없으면 TTS_SAMPLE_RATE, mono, 16bit로 간주.
+    """
+    if audio[:4] != b"RIFF":
+        return PCMAudio(audio, TTS_SAMPLE_RATE, 1, 2)
+    with wave.open(io.BytesIO(audio), "rb") as wf:
+        return PCMAudio(wf.readframes(wf.getnframes()), wf.getframerate(), wf.getnchannels(), wf.getsampwidth())
+
+
+def write_wav(pcm, output_file):
+    """PCMAudio를 WAV 파일로 저장합니다."""
+    with wave.open(output_file, "wb") as wf:
+        wf.setnchannels(pcm.channels)
+        wf.setsampwidth(pcm.sample_width)
+        wf.setframerate(pcm.sample_rate)
+        wf.writeframes(pcm.samples)
+
+
+def play_pcm(pcm, wait=True):
+    """
+    PCMAudio를 파일을 거치지 않고 메모리 버퍼에서 바로 재생합니다.
+
+    Parameters:
+        pcm (PCMAudio): 재생할 음성.
+        wait (bool): True면 재생이 끝날 때까지 기다림.
+
+    Returns:
+        simpleaudio.PlayObject: 재생 객체 (wait=False일 때 나중에 wait_done()으로 기다릴 수 있음).
+    """
+    play_obj = sa.play_buffer(pcm.samples, pcm.channels, pcm.sample_width, pcm.sample_rate)
+    if wait:
+        play_obj.wait_done()
+    return play_obj
+
+
+def _save_log_audio(ssml_texts, output_file, pcm):
+    # 기록용 파일: .mp3면 같은 문장을 MP3로도 합성(캐시 사용)해서 저장, 아니면 PCM을 WAV로 저장
+    if output_file.lower().endswith(".mp3"):
+        audio = b"".join(synthesize_speech(text, "MP3") for text in ssml_texts)
+        with open(output_file, "wb") as out:
+            out.write(audio)
+    else:
+        write_wav(pcm, output_file)
+    print(f'Audio content written to file "{output_file}"')
+
+
+def text_to_speech_ssml(ssml_text, output_file=None, use_cache=True, audio_encoding="MP3"):
+    """
+    문장을 합성합니다.
+
+    Parameters:
+        ssml_text (str): 합성할 문장 (SSML).
+        output_file (str): 음성을 저장할 파일 경로. LINEAR16 모드에서는 기록용으로만 쓰이며 없으면 저장하지 않음.
+        use_cache (bool): TTS 캐시 사용 여부.
+        audio_encoding (str): "MP3"면 파일로 저장, "LINEAR16"이면 PCMAudio를 메모리로 반환.
+
+    Returns:
+        PCMAudio 또는 bytes: LINEAR16이면 바로 play_pcm으로 재생할 수 있는 PCMAudio, 아니면 합성된 음성 bytes.
+    """
+    if audio_encoding == "LINEAR16":
+        pcm = decode_linear16(synthesize_speech(ssml_text, "LINEAR16", use_cache=use_cache))
+        if output_file:
+            _save_log_audio([ssml_text], output_file, pcm)
+        return pcm
+
+    audio = synthesize_speech(ssml_text, audio_encoding, use_cache=use_cache)
+
     # 음성 파일 저장
-    with open(output_file, "wb") as out:
-        out.write(response.audio_content)
-        print(f'Audio content written to file "{output_file}"')
+    if output_file:
+        with open(output_file, "wb") as out:
+            out.write(audio)
+            print(f'Audio content written to file "{output_file}"')
+    return audio
+
+
+def text_to_speech_fragments(fragments, output_file=None, audio_encoding="MP3"):
+    """
+    문장을 조각(고정 문구와 버스 번호 같은 바뀌는 값)별로 캐시에서 가져오거나 합성해서 이어 붙입니다.
+    MP3는 프레임 단위라 이어 붙인 파일도 그대로 재생됨.
+    LINEAR16이면 조각마다 WAV 헤더를 벗겨내고 샘플만 이어 붙여 PCMAudio로 반환.
+    """
+    fragments = [fragment for fragment in fragments if fragment]
+
+    if audio_encoding == "LINEAR16":
+        pcms = [decode_linear16(synthesize_speech(fragment, "LINEAR16")) for fragment in fragments]
+        if not pcms:
+            return PCMAudio(b"", TTS_SAMPLE_RATE, 1, 2)
+        pcm = pcms[0]._replace(samples=b"".join(p.samples for p in pcms))
+        if output_file:
+            _save_log_audio(fragments, output_file, pcm)
+        return pcm
+
+    audio = b"".join(synthesize_speech(fragment, audio_encoding) for fragment in fragments)
+
+    if output_file:
+        with open(output_file, "wb") as out:
+            out.write(audio)
+            print(f'Audio content written to file "{output_file}"')
+    return audio
+
+
+def split_sentences(text):
+    """긴 문장을 문장 단위(. ! ? 뒤)로 나눕니다. 빈 조각은 버림."""
+    return [sentence.strip() for sentence in re.split(r"(?<=[.!?])\s+", text) if sentence.strip()]
+
+
+# 안내 문장을 여러 구간(도착 여부, 첫번째 도착 예정시간, 두번째 도착 예정시간 ...)으로 나눠서
+# 모든 구간의 합성을 동시에 시작하고, 첫 구간이 준비되는 즉시 재생을 시작하는 안내기
+# 앞 구간을 재생하는 동안 뒤 구간들이 합성되므로 첫 소리가 나올 때까지의 시간이 전체 합성 시간보다 짧아짐
+class StreamingAnnouncer:
+    def __init__(self, max_workers=3):
+        """
+        Parameters:
+            max_workers (int): 동시에 합성할 최대 구간 수.
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts")
+        self.last_timings = {}
+
+    @staticmethod
+    def _segments(message):
+        # 문자열이면 문장 단위로 나누고, 리스트면 각 원소를 구간으로 봄
+        # 구간은 문자열 하나이거나 이어 붙일 조각들의 리스트 (EX) arrival_message_fragments의 결과)
+        if isinstance(message, str):
+            return [[sentence] for sentence in split_sentences(message)]
+        return [[segment] if isinstance(segment, str) else list(segment) for segment in message]
+
+    def _synthesize(self, fragments):
+        return text_to_speech_fragments(fragments, audio_encoding="LINEAR16")
+
+    def announce(self, message):
+        """
+        안내 문장을 구간별로 합성하면서 순서대로 재생합니다. 재생이 모두 끝나면 반환.
+
+        Parameters:
+            message (str 또는 list): 안내할 문장, 또는 구간들의 리스트.
+
+        Returns:
+            dict: first_audio(첫 소리까지 걸린 시간), total(전체 걸린 시간), segments(구간 수).
+        """
+        start = time.time()
+        segments = [segment for segment in self._segments(message) if any(segment)]
+        futures = [self.executor.submit(self._synthesize, segment) for segment in segments]
+
+        first_audio = None
+        for future in futures:
+            try:
+                pcm = future.result()
+            except Exception as e:
+                print(f"TTS segment synthesis failed: {str(e)}")
+                continue
+            if not pcm.samples:
+                continue
+            if first_audio is None:
+                first_audio = time.time() - start
+            play_pcm(pcm)
+
+        self.last_timings = {"first_audio": first_audio, "total": time.time() - start, "segments": len(segments)}
+        print(f"TTS first audio after {first_audio} seconds.")
+        return self.last_timings
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def warm_up_tts_cache(phrases=TTS_STATIC_PHRASES, audio_encoding="LINEAR16"):
+    """고정 문구들을 미리 합성해서 캐시에 넣어둡니다 (이미 있으면 건너뜀)."""
+    for phrase in phrases:
+        try:
+            synthesize_speech(phrase, audio_encoding)
+        except Exception as e:
+            print(f"TTS warm-up failed for '{phrase}': {str(e)}")
+            return
+    print(f"TTS cache warmed up : {get_tts_cache().stats()}")
 
 #=============================== GPS ===========================
+# 위치를 가져올 때 기본 조건: 이 시간(초)보다 오래된 위치는 쓰지 않고, 위치가 없으면 이 시간(초)까지만 기다림
+GPS_MAX_AGE = 10.0
+GPS_TIMEOUT = 5.0
+
 # ROS 노드 초기화 및 GPS 데이터 수신
-# 전역 변수
+# 전역 변수 (마지막으로 받은 위치)
 latitude = None
 longitude = None
 
-class GPSNode(Node):
-    def __init__(self):
-        super().__init__('gps_receive_node')
-        self.create_subscription(
-            NavSatFix,
-            '/fix',
-            self.gps_callback,
-            10
-        )
+# 마지막으로 받은 GPS 위치 (위도, 경도, 수신 시각, 수평 정확도[m] - 알 수 없으면 None)
+GPSFix = namedtuple("GPSFix", ["latitude", "longitude", "timestamp", "accuracy"])
+
+
+_gps_node_class = None
+
+
+def get_gps_node_class():
+    """
+    ROS 노드 클래스(GPSNode)를 처음 필요할 때 만들어 반환합니다.
+    rclpy.node.Node를 상속해야 하므로 모듈을 불러올 때 정의하면 ROS를 쓰지 않는 경로도 rclpy를 import하게 됨.
+    """
+    global _gps_node_class
+    if _gps_node_class is not None:
+        return _gps_node_class
+
+    from rclpy.node import Node
+    from sensor_msgs.msg import NavSatFix
+
+    class GPSNode(Node):
+        def __init__(self, on_fix=None):
+            super().__init__('gps_receive_node')
+            self.on_fix = on_fix
+            self.create_subscription(
+                NavSatFix,
+                '/fix',
+                self.gps_callback,
+                10
+            )
+
+        def gps_callback(self, msg):
+            global latitude, longitude
+            latitude = float(format(msg.latitude, f'.{sys.float_info.dig}f'))
+            longitude = float(format(msg.longitude, f'.{sys.float_info.dig}f'))
+
+            # 공분산이 주어진 경우 동/북 방향 분산 중 큰 값으로 수평 정확도(m) 계산
+            accuracy = None
+            if msg.position_covariance_type != NavSatFix.COVARIANCE_TYPE_UNKNOWN:
+                accuracy = float(np.sqrt(max(msg.position_covariance[0], msg.position_covariance[4])))
+
+            if self.on_fix is not None:
+                self.on_fix(latitude, longitude, accuracy)
+
+    _gps_node_class = GPSNode
+    return _gps_node_class
+
+
+# ROS /fix 토픽을 구독해서 GPSService에 위치를 전달하는 소스
+class ROSGPSSource:
+    def run(self, service, stop_event):
+        if not rclpy.ok():
+            rclpy.init()
+        GPSNode = get_gps_node_class()
+        gps_node = GPSNode(on_fix=service.update)
+        executor = rclpy_executors.SingleThreadedExecutor()
+        executor.add_node(gps_node)
+        try:
+            # spin 대신 짧게 돌려서 stop_event로 종료할 수 있게 함
+            while not stop_event.is_set() and rclpy.ok():
+                executor.spin_once(timeout_sec=0.1)
+        finally:
+            executor.remove_node(gps_node)
+            gps_node.destroy_node()
+            if rclpy.ok():
+                rclpy.shutdown()
+
+
+# 파일에 기록해 둔 위치를 재생하는 소스 (ROS 없이 테스트용)
+# 파일은 한 줄에 "latitude,longitude[,accuracy]" 형식, #으로 시작하는 줄은 무시
+class ReplayGPSSource:
+    def __init__(self, path=None, fixes=None, rate=1.0, loop=False):
+        """
+        Parameters:
+            path (str): 재생할 위치 기록 파일.
+            fixes (list): 파일 대신 직접 넘기는 (latitude, longitude[, accuracy]) 리스트.
+            rate (float): 초당 재생할 위치 수.
+            loop (bool): 끝까지 재생하면 처음부터 다시 재생.
+        """
+        if fixes is None:
+            fixes = []
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        fixes.append(tuple(float(v) for v in line.split(",")))
+        self.fixes = list(fixes)
+        self.rate = rate
+        self.loop = loop
+
+    def run(self, service, stop_event):
+        if not self.fixes:
+            print("GPS replay has no fixes to play.")
+            return
+        while not stop_event.is_set():
+            for fix in self.fixes:
+                accuracy = fix[2] if len(fix) > 2 else None
+                service.update(fix[0], fix[1], accuracy)
+                if stop_event.wait(1.0 / self.rate):
+                    return
+            if not self.loop:
+                return
+
+
+# /fix 토픽을 한 번만 구독해두고 최신 위치를 시각/정확도와 함께 보관하는 백그라운드 GPS 서비스
+# 위치가 필요할 때는 get_fix로 기다리지 않고(또는 정해진 시간까지만 기다려서) 가져감
+class GPSService:
+    def __init__(self, source=None):
+        """
+        Parameters:
+            source: run(service, stop_event)를 가진 위치 소스. 없으면 ROSGPSSource.
+        """
+        self.source = source if source is not None else ROSGPSSource()
+        self.fix = None
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="gps-service", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            self.source.run(self, self._stop_event)
+        except Exception as e:
+            print(f"GPS source stopped: {str(e)}")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def update(self, latitude, longitude, accuracy=None, timestamp=None):
+        """소스가 새 위치를 받았을 때 호출."""
+        fix = GPSFix(latitude, longitude, timestamp or time.time(), accuracy)
+        with self._cond:
+            first_fix = self.fix is None
+            self.fix = fix
+            self._cond.notify_all()
+        if first_fix:
+            print(f"GPS data received. Latitude: {latitude}, Longitude: {longitude}")
+
+    def get_fix(self, max_age=None, timeout=None):
+        """
+        최신 위치를 반환합니다.
 
-    def gps_callback(self, msg):
-        global latitude, longitude
-        latitude = float(format(msg.latitude, f'.{sys.float_info.dig}f'))
-        longitude = float(format(msg.longitude, f'.{sys.float_info.dig}f'))
-        print(f"Latitude: {latitude}, Longitude: {longitude}")
-        # 노드 종료를 위한 조건 (옵션): 데이터를 수신하면 노드 종료
-        self.get_logger().info('GPS data received.')
-
-def gps_sub():
-    rclpy.init()
-    gps_node = GPSNode()
-    
-    # 노드를 계속 실행하여 데이터 수신
-    rclpy.spin(gps_node)
-    
-    # 노드 종료 후 정리
-    gps_node.destroy_node()
-    rclpy.shutdown()
-    return latitude, longitude
\ No newline at end of file
+        Parameters:
+            max_age (float): 이 시간(초)보다 오래된 위치는 사용하지 않음. None이면 나이 제한 없음.
+            timeout (float): 조건에 맞는 위치가 없을 때 기다릴 최대 시간(초). 0이면 기다리지 않음, None이면 계속 기다림.
+
+        Returns:
+            GPSFix: 조건에 맞는 위치. 시간 안에 받지 못하면 None.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while True:
+                fix = self.fix
+                if fix is not None and (max_age is None or time.time() - fix.timestamp <= max_age):
+                    return fix
+                if deadline is None:
+                    self._cond.wait(1.0)
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+
+_gps_service = None
+_gps_service_lock = threading.Lock()
+
+
+def get_gps_service():
+    """
+    프로세스에서 하나만 쓰는 GPSService를 시작해서 반환합니다.
+    환경 변수 BBS_GPS_REPLAY에 위치 기록 파일 경로가 있으면 ROS 대신 그 파일을 재생합니다.
+    """
+    global _gps_service
+    with _gps_service_lock:
+        if _gps_service is None:
+            replay_path = os.environ.get("BBS_GPS_REPLAY")
+            source = ReplayGPSSource(replay_path, loop=True) if replay_path else None
+            _gps_service = GPSService(source).start()
+        return _gps_service
+
+
+def gps_sub(max_age=GPS_MAX_AGE, timeout=GPS_TIMEOUT):
+    """
+    백그라운드 GPS 서비스에서 (위도, 경도)를 가져옵니다.
+    max_age초 안의 위치를 timeout초 안에 받지 못하면 (None, None). (None으로 주면 제한 없음)
+    """
+    fix = get_gps_service().get_fix(max_age=max_age, timeout=timeout)
+    if fix is None:
+        print("Failed to get GPS coordinates")
+        return None, None
+    return fix.latitude, fix.longitude
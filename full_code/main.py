@@ -1,4 +1,4 @@
-from func_utils import API, YOLOVideoCapture, FrameProcessor, text_to_speech_ssml, gps_sub, recognize_speech_from_audio, extract_bus_number, determine_intent, record_audio
+from func_utils import API, arrival_message_fragments, warm_up_tts_cache, play_pcm, StreamingAnnouncer, YOLOVideoCapture, FrameProcessor, PlateTracker, CropQualityGate, BusInfoPipeline, arrival_messages, text_to_speech_ssml, gps_sub, get_gps_service, GPS_MAX_AGE, GPS_TIMEOUT, recognize_speech_from_audio, extract_bus_number, determine_intent, record_audio
 import psycopg2
 import requests
 import xml.etree.ElementTree as ET
@@ -10,8 +10,6 @@ import pygame
 import rospy
 from sensor_msgs.msg import NavSatFix
 import sys
-import simpleaudio as sa
-from pydub import AudioSegment
 import numpy as np
 import time
 
@@ -21,6 +19,12 @@ start_time = time.time()
 # 환경 변수 설정
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = '/home/minseokim521/catkin_ws/src/bus/zippy-brand-429513-k7-6ef67897540d.json'
 
+# 자주 쓰는 고정 안내 문구를 백그라운드에서 미리 합성해 TTS 캐시에 저장
+threading.Thread(target=warm_up_tts_cache, daemon=True).start()
+
+# GPS 구독을 미리 시작해서 정류소 조회 시점에는 이미 위치를 받아둔 상태가 되게 함
+get_gps_service()
+
 # 비디오 경로와 모델 경로 설정
 # video_path = '/home/LOE/workspace/yolo/Archive/vid/KakaoTalk_20240812_133651375.mp4'
 model_path = "/home/minseokim521/catkin_ws/src/bus/Blind_Bus_Support-bbs-/models/best_3000_n.pt"
@@ -45,56 +49,46 @@ plate_class_indices = [idx for idx, name in video_capture.model.names.items() if
 # YOLO 모델로 프레임 처리
 padding = 5
 min_confidence = 0.8
+# YOLO가 이미 번호판 위치를 찾았으므로 EasyOCR의 텍스트 검출은 건너뛰고 인식기만 사용
+ocr_mode = "recognize"
 frame_processor = FrameProcessor(
     video_capture.model, plate_class_indices, easy_ocr,
-    video_capture.width, video_capture.height, padding, min_confidence
+    video_capture.width, video_capture.height, padding, min_confidence,
+    ocr_mode=ocr_mode,
+    # 프레임 사이에서 같은 번호판을 추적해 번호판마다 한 번만 OCR
+    tracker=PlateTracker(),
+    # 흐리거나 작거나 노출이 나쁜 크롭은 OCR 전에 거르고 점수 높은 크롭만 OCR
+    quality_gate=CropQualityGate()
 )
-ocr_number = []
-# 비디오에서 프레임을 읽어와 처리
-for i, frames in enumerate(video_capture.read_frames()):
-    for frame in frames:
-        results = video_capture.model(frame)
-        
-
-    ocr_number.append(frame_processor.process_frame(frames))
-    if ocr_number[i]:
-        print(f"OCR 결과로 추출된 번호판: {ocr_number[i]}")
-        
-print(f"ocr_number : {ocr_number}")
-
-
-# ocr결과에서 None을 제거
-filtered_ocr_numbers = [num for num in ocr_number if num is not None]
-
-
-print(f"filtered_ocr_number : {filtered_ocr_numbers}")
+bus_api = API()
 
+# 캡처 -> YOLO -> OCR -> 버스 정보 조회를 스레드 파이프라인으로 실행
+# GPS 위치, 가까운 정류소, 정류소 도착 정보 조회는 영상 처리와 동시에 진행됨
+# 번호가 확실해지면 바로 캡처를 끝내고, 증거가 약하면 최대 capture_deadline초까지 계속 캡처
+capture_deadline = 3.0
+# 위치는 GPS_MAX_AGE초 이내의 것만 쓰고, 없으면 GPS_TIMEOUT초까지만 기다림
+locate = lambda: gps_sub(max_age=GPS_MAX_AGE, timeout=GPS_TIMEOUT)
+pipeline = BusInfoPipeline(video_capture, frame_processor, bus_api, locate, capture_deadline=capture_deadline)
+result = pipeline.run()
 
 # 비디오 캡처 해제
 video_capture.release()
 
+Bus_num = result["bus_num"]
+print(f"OCR 결과로 추출된 번호판: {Bus_num}")
 
-if ocr_number[0] == None:
+if Bus_num == None:
     msg1 = "아무 번호도 인식되지 않았습니다."
     print("아무 번호도 인식되지 않았습니다.")
-    text_to_speech_ssml(msg1, "ocr.mp3")
+    # PCM으로 합성해서 파일 변환 없이 메모리에서 바로 재생
+    pcm = text_to_speech_ssml(msg1, audio_encoding="LINEAR16")
         
     # 소리재생
 
     print('sound playing')
 
-    # MP3 파일 로드
-    sound = AudioSegment.from_mp3("ocr.mp3")
-
-    # WAV 파일로 변환
-    sound.export("ocr.wav", format="wav")
-
-    # 오디오 파일 로드
-    wave_obj = sa.WaveObject.from_wave_file("ocr.wav")
-
     # 오디오 재생
-    play_obj = wave_obj.play()
-    play_obj.wait_done()  # 재생이 끝날 때까지 기다림
+    play_pcm(pcm)  # 재생이 끝날 때까지 기다림
 
     print('sound_ends')
     print("end of the code")
@@ -106,7 +100,7 @@ if ocr_number[0] == None:
 #걸린 시간 출력
 yolo_ocr_end = time.time()
 
-print(f"Yolo + OCR section took {yolo_ocr_end - yolo_ocr_start} seconds. ")
+print(f"Yolo + OCR + API section took {yolo_ocr_end - yolo_ocr_start} seconds. ")
 
 '''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
 ------------------------------------------------------------------------------------------------------------------------------------
@@ -115,84 +109,24 @@ print(f"Yolo + OCR section took {yolo_ocr_end - yolo_ocr_start} seconds. ")
 ------------------------------------------------------------------------------------------------------------------------------------
 ------------------------------------------------------------------------------------------------------------------------------------
 '''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
-api_start = time.time()
-
-
-# GPS 데이터를 받아오고 그 값을 변수에 저장
-
-latitude, longitude = gps_sub()
-# latitude, longitude = 126.90509208, 37.5158657465
+# (조회는 파이프라인 안에서 영상 처리와 동시에 끝남, 여기서는 결과만 확인)
+print(f"찾아낸 정류소의 이름 :{result['station_name']}, 찾아낸 정류소의 id :{result['station_id']}")
 
-# if latitude is None or longitude is None:
-#     print("Failed to get GPS coordinates")
-# else:
-#     print(f"Received coordinates: Latitude={latitude}, Longitude={longitude}")
-bus_api = API()
-
-Bus_num = filtered_ocr_numbers[0]
-
-#데이터 베이스 상에서 버스 번호와 정류소 이름에 해당하는 id값 가져오기
-bus_result = bus_api.database_query('bus', 'routeid', 'bus_id', Bus_num)
-station_list = bus_api.database_query_specific_column("station", 'node_id')
-station_name_list = bus_api.database_query_specific_column("station", 'station_name')
-X_locations = bus_api.database_query_specific_column("station", 'X_location')
-Y_locations = bus_api.database_query_specific_column("station", 'Y_location')
-
-# 리스트 평탄화
-X_locations = [x[0] for x in X_locations]
-Y_locations = [y[0] for y in Y_locations]
-
-# 가장 가까운 정류소 인덱스 찾기
-index = bus_api.find_nearest_index(longitude, latitude, X_locations, Y_locations)
-station_name = station_name_list[index]
-station_id = station_list[index]
-
-print(f"찾아낸 정류소의 이름 :{station_name}, 찾아낸 정류소의 id :{station_id}")
-
-if bus_result == None:
+if result["routeid"] == None:
     print("OCR상의 버스 번호가 DB와 일치하지 않습니다.")
     exit()
-# api 상에서 station id에 해당하는 정류소에 운행하는 버스정보 가져오기
-response2 = bus_api.station_bus_list(station_id[0])
-
-#xml 값을 가져옴
-root2 = ET.fromstring(response2)
 
-# 정류소에서 운행하는 버스 이름 정보 리스트
-bus_list = bus_api.find_xml_val(root2, "busRouteAbrv")
+# 정류소에서 운행하는 버스 중 인식한 버스 정보
+arrival = result["arrival"]
 
-# 버스 리스트에서 인식한 버스 정보가 있는지 찾음
-index, result = bus_api.find_api_val(bus_list, Bus_num)
-
-isArrive1 = []
-arrmsg1_list = []
-arrmsg2_list = []
-
-if result:
-    isArrive1 = bus_api.find_xml_val(root2, "isArrive1")
-    arrmsg1_list = bus_api.find_xml_val(root2, "arrmsg1")
-    arrmsg2_list = bus_api.find_xml_val(root2, "arrmsg2")
-else:
+if arrival is None:
     exit()
-msg1, msg2, msg3 = 0,0,0
-
-# 변수 출력
-if not(isArrive1[index]):
-    msg1 = f"{Bus_num}번 버스가 도착했습니다."
-    print(msg1)
-    
-else:
-    msg1 = f"{Bus_num}번 버스가 도착하지 않았습니다."
-    print(msg1)
-    
-msg2 = "첫번째 버스 도착 예정시간 :" + arrmsg1_list[index] 
-msg3 = "두번째 버스 도착 예정시간 :" + arrmsg2_list[index] 
+
+msg1, msg2, msg3 = arrival_messages(Bus_num, arrival)
+print(msg1)
 print(msg2)
 print(msg3)
 
-api_end = time.time()
-print(f"API section took {api_end - api_start} seconds.")
-
 '''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
 ------------------------------------------------------------------------------------------------------------------------------------
 ------------------------------------------------------------------------------------------------------------------------------------
@@ -202,24 +136,17 @@ print(f"API section took {api_end - api_start} seconds.")
 '''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
 tts_start = time.time()
 
-# 텍스트를 mp3파일로 저장, 이미 있는경우 덮어씀
-text_to_speech_ssml(msg1 + msg2 + msg3, "ocr.mp3")
+# 도착 여부 / 첫번째 도착 예정시간 / 두번째 도착 예정시간을 구간별로 동시에 합성하고
+# 첫 구간이 준비되는 즉시 재생 시작 (앞 구간을 재생하는 동안 뒤 구간 합성)
+# 고정 문구는 TTS 캐시에서 가져오고 버스 번호/도착 예정시간만 새로 합성해서 이어 붙임
+announcer = StreamingAnnouncer()
 
 # 소리재생
 print('sound playing')
 
-# MP3 파일 로드
-sound = AudioSegment.from_mp3("ocr.mp3")
-
-# WAV 파일로 변환
-sound.export("ocr.wav", format="wav")
-
-# 오디오 파일 로드
-wave_obj = sa.WaveObject.from_wave_file("ocr.wav")
-
 # 오디오 재생
-play_obj = wave_obj.play()
-play_obj.wait_done()  # 재생이 끝날 때까지 기다림
+announcer.announce(arrival_message_fragments(Bus_num, arrival))  # 재생이 끝날 때까지 기다림
+announcer.close()
 
 print('sound_ends')
 print("end of the code")
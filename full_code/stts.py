@@ -1,17 +1,17 @@
-from func_utils import API, text_to_speech_ssml, gps_sub, recognize_speech_from_audio, extract_bus_number, determine_intent, record_audio
+from func_utils import API, arrival_message_fragments, warm_up_tts_cache, play_pcm, StreamingAnnouncer, arrival_messages, text_to_speech_ssml, gps_sub, get_gps_service, GPS_MAX_AGE, GPS_TIMEOUT, streaming_recognize_speech, determine_intent
 import os
-import pyaudio
-import simpleaudio as sa
-from pydub import AudioSegment
-from google.cloud import speech
-from google.cloud import texttospeech
-import requests 
-import xml.etree.ElementTree as ET
+import threading
 
 
 # 환경 변수 설정
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "C:/Users/이유진/Documents/2024/IDP_LAB/google cloud platform/zippy-brand-429513-k7-6ef67897540d.json"
 
+# 자주 쓰는 고정 안내 문구를 백그라운드에서 미리 합성해 TTS 캐시에 저장
+threading.Thread(target=warm_up_tts_cache, daemon=True).start()
+
+# GPS 구독을 미리 시작해서 음성 인식이 끝났을 때는 이미 위치를 받아둔 상태가 되게 함
+get_gps_service()
+
 '''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
 ------------------------------------------------------------------------------------------------------------------------------------
 ------------------------------------------------------------------------------------------------------------------------------------
@@ -20,18 +20,14 @@ os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "C:/Users/이유진/Documents/202
 ------------------------------------------------------------------------------------------------------------------------------------
 '''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
 
-# 음성을 녹음하여 WAV 파일로 저장
-audio_filename = "user_input.wav"
-record_audio(5, audio_filename)
-
-# 녹음된 오디오 파일에서 STT로 텍스트 인식
-recognized_text = recognize_speech_from_audio(audio_filename)
+# 녹음하면서 바로 스트리밍 인식 (5초 고정 녹음 대신 말이 끝나면 VAD로 종료)
+# 중간 결과에서 버스 번호가 확정되면 그 즉시 녹음과 인식을 멈춤
+recognized_text, bus_number = streaming_recognize_speech(stop_on_number=True)
 
 # 인식된 텍스트 확인
 print(f"인식된 텍스트: {recognized_text}")
 
-# 버스 번호와 의도 추출
-bus_number = extract_bus_number(recognized_text)
+# 의도 추출
 intent = determine_intent(recognized_text)
 
 # 추출된 결과 확인
@@ -41,40 +37,36 @@ print(f"추출된 의도: {intent}")
 if bus_number is None:
     msg = "버스 번호를 인식할 수 없습니다. 다시 시도해주세요."
     print(msg)
-    text_to_speech_ssml(msg, "stt_error.mp3")
+    pcm = text_to_speech_ssml(msg, audio_encoding="LINEAR16")
     
-    # 음성 출력
-    sound = AudioSegment.from_mp3("stt_error.mp3")
-    sound.export("stt_error.wav", format="wav")
-    wave_obj = sa.WaveObject.from_wave_file("stt_error.wav")
-    play_obj = wave_obj.play()
-    play_obj.wait_done()
+    # 음성 출력 (파일 변환 없이 메모리에서 바로 재생)
+    play_pcm(pcm)
 
     exit()
 
 
 # GPS 데이터를 받아오고 그 값을 변수에 저장
-latitude, longitude = gps_sub()
+# GPS_MAX_AGE초 이내의 위치만 쓰고, 없으면 GPS_TIMEOUT초까지만 기다림
+latitude, longitude = gps_sub(max_age=GPS_MAX_AGE, timeout=GPS_TIMEOUT)
+
+if latitude is None:
+    print("GPS 위치를 받지 못했습니다.")
+    exit()
 
 bus_api = API()
 
 
 
-# 데이터베이스에서 버스 번호와 정류소 이름에 해당하는 id값 가져오기
-bus_result = bus_api.database_query('bus', 'routeid', 'bus_id', bus_number)
-station_list = bus_api.database_query_specific_column("station", 'node_id')
-station_name_list = bus_api.database_query_specific_column("station", 'station_name')
-X_locations = bus_api.database_query_specific_column("station", 'X_location')
-Y_locations = bus_api.database_query_specific_column("station", 'Y_location')
+# 메모리 사전에서 버스 번호에 해당하는 routeid 가져오기
+bus_result = bus_api.resolve_bus_route(bus_number)
 
-# 리스트 평탄화
-X_locations = [x[0] for x in X_locations]
-Y_locations = [y[0] for y in Y_locations]
+# 정류소 정보는 로컬 스냅샷에서 읽음 (오래된 경우에만 DB 버전 확인 후 갱신)
+stations = bus_api.load_station_snapshot()
 
 # 가장 가까운 정류소 인덱스 찾기
-index = bus_api.find_nearest_index(longitude, latitude, X_locations, Y_locations)
-station_name = station_name_list[index]
-station_id = station_list[index]
+index = bus_api.find_nearest_index(longitude, latitude)
+station_name = stations.station_name[index]
+station_id = stations.node_id[index]
 print(f"찾아낸 정류소의 이름 :{station_name}, 찾아낸 정류소의 id :{station_id}")
 
 if bus_result == None:
@@ -82,41 +74,20 @@ if bus_result == None:
     exit()
 
 # 정류소에 운행하는 버스정보 가져오기
-response2 = bus_api.station_bus_list(station_id[0])
+response2 = bus_api.station_bus_list(station_id)
 
-# xml 값을 가져옴
-root2 = ET.fromstring(response2)
+# 응답 xml을 한 번만 파싱해서 버스 번호로 찾을 수 있는 표로 만듦
+arrivals = bus_api.parse_arrival_info(response2)
 
-# 정류소에서 운행하는 버스 이름 정보 리스트
-bus_list = bus_api.find_xml_val(root2, "busRouteAbrv")
+# 정류소에서 운행하는 버스 중 인식한 버스 정보를 찾음
+arrival = arrivals.find(bus_number)
 
-# 버스 리스트에서 인식한 버스 정보가 있는지 찾음
-index, result = bus_api.find_api_val(bus_list, bus_number)
-
-isArrive1 = []
-arrmsg1_list = []
-arrmsg2_list = []
-
-if result:
-    isArrive1 = bus_api.find_xml_val(root2, "isArrive1")
-    arrmsg1_list = bus_api.find_xml_val(root2, "arrmsg1")
-    arrmsg2_list = bus_api.find_xml_val(root2, "arrmsg2")
-else:
+if arrival is None:
     print("인식된 버스가 해당 정류소에서 운행되지 않습니다.")
     exit()
 
-stt_msg1, stt_msg2, stt_msg3 = 0, 0, 0
-
-# 변수 출력
-if not(isArrive1[index]):
-    stt_msg1 = f"{bus_number}번 버스가 도착했습니다."
-    print(stt_msg1)
-else:
-    stt_msg1 = f"{bus_number}번 버스가 도착하지 않았습니다."
-    print(stt_msg1)
-    
-stt_msg2 = "첫번째 버스 도착 예정시간 :" + arrmsg1_list[index] 
-stt_msg3 = "두번째 버스 도착 예정시간 :" + arrmsg2_list[index] 
+stt_msg1, stt_msg2, stt_msg3 = arrival_messages(bus_number, arrival)
+print(stt_msg1)
 print(stt_msg2)
 print(stt_msg3)
 
@@ -128,18 +99,15 @@ print(stt_msg3)
 ------------------------------------------------------------------------------------------------------------------------------------
 '''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
 
-# 텍스트를 mp3파일로 저장, 이미 있는경우 덮어씀
-text_to_speech_ssml(stt_msg1 + stt_msg2 + stt_msg3, "bus_info.mp3")
+# 도착 여부 / 첫번째 도착 예정시간 / 두번째 도착 예정시간을 구간별로 동시에 합성하고
+# 첫 구간이 준비되는 즉시 재생 시작 (앞 구간을 재생하는 동안 뒤 구간 합성)
+# 고정 문구는 TTS 캐시에서 가져오고 버스 번호/도착 예정시간만 새로 합성해서 이어 붙임
+announcer = StreamingAnnouncer()
 
 # 소리재생
 print('sound playing')
-
-# MP3 파일 로드
-sound = AudioSegment.from_mp3("bus_info.mp3")
-sound.export("bus_info.wav", format="wav")
-wave_obj = sa.WaveObject.from_wave_file("bus_info.wav")
-play_obj = wave_obj.play()
-play_obj.wait_done()  # 재생이 끝날 때까지 기다림
+announcer.announce(arrival_message_fragments(bus_number, arrival))  # 재생이 끝날 때까지 기다림
+announcer.close()
 
 print('sound_ends')
 
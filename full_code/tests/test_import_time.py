@@ -0,0 +1,33 @@
+import json
+import os
+import subprocess
+import sys
+
+FULL_CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# func_utils를 import할 때 불러오면 안 되는 무거운 모듈 (처음 사용할 때만 import되어야 함)
+HEAVY_MODULES = ("cv2", "torch", "ultralytics", "google", "rclpy", "psycopg2", "aiohttp", "pyaudio", "simpleaudio")
+
+# 음성 경로(stts.py)의 시작 시간 예산(초)
+IMPORT_BUDGET = 1.0
+
+CHECK_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import func_utils
+elapsed = time.perf_counter() - start
+heavy = sorted(name for name in sys.modules if name.split(".")[0] in {heavy!r})
+print(json.dumps({{"elapsed": elapsed, "heavy": heavy}}))
+"""
+
+
+def test_func_utils_import_is_fast_and_lazy():
+    # 다른 테스트가 이미 불러온 모듈의 영향을 받지 않도록 새 프로세스에서 측정
+    output = subprocess.check_output(
+        [sys.executable, "-c", CHECK_SCRIPT.format(heavy=set(HEAVY_MODULES))],
+        cwd=FULL_CODE_DIR,
+    )
+    result = json.loads(output.decode().strip().splitlines()[-1])
+
+    assert result["heavy"] == [], f"heavy modules imported at load time: {result['heavy']}"
+    assert result["elapsed"] < IMPORT_BUDGET, f"import func_utils took {result['elapsed']:.3f}s"